@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+'''cold start benchmark - guards how long the rig takes to come up after a power cycle
+
+Every run is a fresh interpreter, which imports padstrument and builds a Padstrument
+on the simulated nanoPADs in padsim - the scale table is compiled on first use in each one.
+
+    ./bench_startup.py                  # exit 1 if the median start is over the default limit
+    ./bench_startup.py --max-ms 400     # with a limit of its own
+'''
+import argparse, json, os, subprocess, sys, time, statistics
+
+here = os.path.dirname( os.path.abspath(__file__) )
+max_ms = 750 # default limit on the median total - a start takes about 190 ms on a desktop, this leaves headroom for a slow board
+
+probe = """
+import time, json
+t0 = time.perf_counter()
+import padstrument
+t1 = time.perf_counter()
+pad = padstrument.Padstrument( backend='padsim' )
+t2 = time.perf_counter()
+print( json.dumps( { 'import':t1-t0, 'construct':t2-t1 } ) )
+"""
+
+def run():
+    '''run the probe in a fresh interpreter, returns a dict of times in ms'''
+    start = time.perf_counter()
+    out = subprocess.run( [ sys.executable, '-c', probe ], cwd=here,
+        capture_output=True, text=True, check=True )
+    total = time.perf_counter() - start
+    times = json.loads( out.stdout.strip().splitlines()[-1] )
+    times['total'] = total
+    return { name: value*1000 for name, value in times.items() }
+
+def summary(runs):
+    return { name: round( statistics.median( run[name] for run in runs ), 2 ) for name in runs[0] }
+
+def main():
+    parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+    parser.add_argument( '--runs', type=int, default=10, help='interpreters started per case' )
+    parser.add_argument( '--max-ms', type=float, default=max_ms, help='fail if the median total is slower, 0 for no limit' )
+    args = parser.parse_args()
+
+    runs = [ run() for n in range( 0, args.runs ) ]
+    report = { 'runs':args.runs, 'start_ms':summary(runs), 'max_ms':args.max_ms }
+    print( json.dumps( report, indent=2 ) )
+
+    if ( args.max_ms and report['start_ms']['total'] > args.max_ms ):
+        print( "start "+str( report['start_ms']['total'] )+" ms is over the "+str( args.max_ms )+" ms limit", file=sys.stderr )
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit( main() )
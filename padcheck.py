@@ -0,0 +1,389 @@
+#!/usr/bin/python3
+'''differential check - the optimized note path against a reference implementation
+
+Reference is a deliberately plain implementation of what the pads should play, kept as an
+oracle: it looks every event up in the raw layout, zone and grid data, works the pitch out
+from the scale intervals, and hands out MPE channels from plain lists - no padmaps, compiled
+routes, note tables, bitsets or linked lists.
+
+Each scenario is generated from its seed alone: a note layout (a built in one or a random
+one), a key (any family and mode in Scales.families), a top pad, a zone map (single, split or
+mpe), and a stream of pad presses/releases, native X-Y pad moves, sustain and latch toggles,
+and settings changes mid stream (key, layout, top pad).
+Both paths play the scenario and their output streams, per port, must be identical.
+A failing scenario is shrunk to its shortest failing prefix before it is reported.
+
+    ./padcheck.py                       # 200 scenarios
+    ./padcheck.py --scenarios 1000 --seed 7 --json report.json
+
+Each scenario reports the time both paths spent turning pad messages into outgoing messages,
+and the speedup of the optimized path.  Both are timed up to the list of messages they produce:
+Reference.play() against Padstrument.handle_msgs(), whose messages are queued for flush_out() -
+sending, metrics and settings changes aren't timed.
+The exit status is 1 if any scenario differs.
+'''
+import argparse, json, logging, random, sys, time
+import mido, padsim, padstrument
+from padstrument import Translate, Layouts, Scales, Zones
+
+zone_maps = ( 'single', 'split', 'mpe' )
+builtin_layouts = tuple( sorted( Layouts.notes ) ) # scenarios only ever pick from these and their own
+
+
+class Reference:
+    '''what the pads should play, worked out the long way round'''
+
+    def __init__(self, tonic, mode, scale, note_layout, zone_map, top):
+        self.tonic = tonic
+        self.mode = mode
+        self.scale = scale
+        self.note_layout = note_layout
+        self.zone_map = zone_map
+        self.top = top
+        self.sustain = False
+        self.latch = False
+        self.started = {}   # (pad, note): outputs the press started - [ (port, channel, note, mpe) ]
+        self.last = {}      # pad: outputs of its last press - X/Y moves go here
+        self.latched = set()    # (port, channel, note) latched on
+        self.sustained = set()  # (port, channel, note) released while sustain is on
+        self.free = {}      # MPE port: free member channels, least recently released first
+        self.busy = {}      # MPE port: busy member channels, oldest note first
+        self.owner = {}     # (port, channel): (pad, note) of the press playing on an MPE channel
+        self.sounding = {}  # (port, channel): note sounding on an MPE channel
+        self.out = {}       # port name: [ messages ]
+
+    def configure(self, tonic=None, mode=None, scale=None, note_layout=None, top=None):
+        if ( scale is not None ):
+            self.scale = scale
+        if ( tonic is not None ):
+            self.tonic = tonic
+        if ( mode is not None ):
+            self.mode = mode
+        if ( note_layout is not None ):
+            self.note_layout = note_layout
+        if ( top is not None ):
+            self.top = top
+
+    def pitch(self, degree, octave):
+        '''scale degree (1 based, any int) and octave to a midi note'''
+        intervals = Scales.families[self.scale]
+        root = intervals[ self.mode - 1 ]
+        steps = sorted( ( interval - root ) % 12 for interval in intervals )
+        index = degree - 1
+        octave += index // len( steps )
+        return self.tonic + steps[ index % len( steps ) ] + 12 * octave
+
+    def grid(self, pad, note):
+        '''(grid_row, col) of a nanopad note'''
+        rows = (0, 1) if pad == self.top else (2, 3)
+        for row in rows:
+            for col in range( 0, 8 ):
+                if ( Translate.grid2note_map[row][col] == note ):
+                    return ( row, col, )
+        return None
+
+    def routes(self, pad, note):
+        '''[ (port, channel, note, mpe member channels) ] a press plays'''
+        row, col = self.grid( pad, note )
+        degree, octave = Layouts.notes[ self.note_layout ][row][col]
+        pitch = self.pitch( degree, octave )
+        cell = Zones.maps[ self.zone_map ][row][col]
+        names = cell if isinstance( cell, tuple ) else ( cell, )
+        routes = []
+        for name in names:
+            zone = Zones.zones[name]
+            if ( 0 <= pitch + zone.transpose <= 127 ):
+                routes.append( ( zone.port, zone.channel, pitch + zone.transpose, zone.mpe, ) )
+        return routes
+
+    def send(self, port, msg):
+        self.out.setdefault( port, [] ).append( msg )
+
+    def allocate(self, port, members, owner, note):
+        '''MPE member channel for a new note - the least recently released free one, or else the
+        oldest busy one, whose note is turned off'''
+        free = self.free.setdefault( port, list( range( 1, members+1 ) ) )
+        busy = self.busy.setdefault( port, [] )
+        if ( free ):
+            channel = free.pop(0)
+        else:
+            channel = busy.pop(0)
+            stolen = self.sounding[ (port, channel) ]
+            self.send( port, mido.Message( 'note_off', channel=channel, note=stolen, velocity=64 ) )
+            self.latched.discard( (port, channel, stolen) )
+            self.sustained.discard( (port, channel, stolen) )
+        busy.append( channel )
+        self.owner[ (port, channel) ] = owner
+        self.sounding[ (port, channel) ] = note
+        return channel
+
+    def release(self, port, channel):
+        self.busy[port].remove( channel )
+        self.free[port].append( channel )
+        del self.owner[ (port, channel) ]
+        del self.sounding[ (port, channel) ]
+
+    def start(self, pad, msg):
+        outs = []
+        for port, channel, note, mpe in self.routes( pad, msg.note ):
+            if ( mpe ):
+                channel = self.allocate( port, mpe, (pad, msg.note), note )
+            self.send( port, mido.Message( 'note_on', channel=channel, note=note, velocity=msg.velocity ) )
+            self.sustained.discard( (port, channel, note) )
+            outs.append( ( port, channel, note, mpe, ) )
+        self.started[ (pad, msg.note) ] = outs
+        self.last[pad] = outs
+        return outs
+
+    def stop(self, pad, note, velocity):
+        '''turn off what a press started - unless another press took its MPE channel.
+        With sustain on the notes keep sounding until sustain is turned off.'''
+        for port, channel, out_note, mpe in self.started.pop( (pad, note), () ):
+            if ( mpe and self.owner.get( (port, channel) ) != (pad, note) ):
+                continue
+            self.latched.discard( (port, channel, out_note) )
+            if ( self.sustain ):
+                self.sustained.add( (port, channel, out_note) )
+                continue
+            if ( mpe ):
+                self.release( port, channel )
+            self.send( port, mido.Message( 'note_off', channel=channel, note=out_note, velocity=velocity ) )
+
+    def is_latched(self, pad, note):
+        outs = self.started.get( (pad, note) )
+        return bool( outs ) and outs[0][:3] in self.latched
+
+    def release_all(self, notes):
+        '''note offs for a set of (port, channel, note), per port in channel then note order'''
+        for port, channel, note in sorted( notes ):
+            if ( (port, channel) in self.owner ):
+                self.release( port, channel )
+            self.send( port, mido.Message( 'note_off', channel=channel, note=note, velocity=64 ) )
+        for sounding in list( notes ):
+            self.latched.discard( sounding )
+            self.sustained.discard( sounding )
+
+    def toggle_sustain(self):
+        self.sustain = not self.sustain
+        if ( not self.sustain ):
+            self.release_all( self.sustained )
+
+    def toggle_latch(self):
+        self.latch = not self.latch
+        if ( not self.latch ):
+            self.release_all( self.latched )
+
+    def play(self, pad, msg):
+        if ( msg.type == "note_on" ):
+            if ( not self.latch ):
+                self.start( pad, msg )
+            elif ( self.is_latched( pad, msg.note ) ):
+                self.stop( pad, msg.note, 64 ) # tap off
+            else:
+                for port, channel, note, mpe in self.start( pad, msg ):
+                    self.latched.add( (port, channel, note) )
+        elif ( msg.type == "note_off" ):
+            if ( not self.is_latched( pad, msg.note ) ):
+                self.stop( pad, msg.note, msg.velocity )
+        elif ( msg.type == "control_change" ):
+            # native mode X-Y pad: X bends, Y is pressure, letting go re-centres both
+            for port, channel, note, mpe in self.last.get( pad, () ):
+                if ( msg.control == padsim.xy_x ):
+                    self.send( port, mido.Message( 'pitchwheel', channel=channel, pitch=( msg.value - 64 ) * 128 ) )
+                elif ( msg.control == padsim.xy_y ):
+                    self.send( port, mido.Message( 'aftertouch', channel=channel, value=msg.value ) )
+                elif ( msg.control == padsim.xy_touch and not msg.value ):
+                    self.send( port, mido.Message( 'pitchwheel', channel=channel, pitch=0 ) )
+                    self.send( port, mido.Message( 'aftertouch', channel=channel, value=0 ) )
+
+def flatten(msg):
+    '''a sent message as a comparable, printable tuple'''
+    if ( msg.type == "pitchwheel" ):
+        return ( msg.type, msg.channel, msg.pitch, None, )
+    if ( msg.type == "aftertouch" ):
+        return ( msg.type, msg.channel, msg.value, None, )
+    return ( msg.type, msg.channel, msg.note, msg.velocity, )
+
+
+def random_layout(rng):
+    return [ [ ( rng.randint( -3, 10 ), rng.randint( 2, 6 ), ) for col in range( 0, 8 ) ] for row in range( 0, 4 ) ]
+
+def random_key(rng):
+    scale = rng.choice( sorted( Scales.families ) )
+    return dict( tonic=rng.randrange( 0, 12 ), mode=rng.randint( 1, len( Scales.families[scale] ) ), scale=scale )
+
+def scenario(seed, length):
+    '''returns (settings, events, layouts) - events are ('msg', pad, message), ('config', kwargs),
+    ('sustain',) or ('latch',), layouts are the scenario's own random note layouts.
+    Depends on nothing but the seed.  Ends with every pad let go and sustain and latch off.'''
+    rng = random.Random( seed )
+    layouts = {}
+    if ( rng.random() < 0.5 ):
+        name = 'check-'+str(seed)
+        layouts[name] = random_layout( rng )
+    else:
+        name = rng.choice( builtin_layouts )
+    settings = dict( note_layout=name, zone_map=rng.choice( zone_maps ), top=rng.randint( 0, 1 ), **random_key( rng ) )
+
+    held = set()
+    toggled = { 'sustain': False, 'latch': False }
+    events = []
+    for n in range( 0, length ):
+        roll = rng.random()
+        pad = rng.randint( 0, 1 )
+        if ( roll < 0.72 ):
+            note = rng.randint( 64, 79 )
+            if ( (pad, note) in held ):
+                held.discard( (pad, note) )
+                events.append( ( 'msg', pad, mido.Message( 'note_off', channel=1, note=note, velocity=64 ), ) )
+            else:
+                held.add( (pad, note) )
+                events.append( ( 'msg', pad, mido.Message( 'note_on', channel=1, note=note, velocity=rng.randint( 1, 127 ) ), ) )
+        elif ( roll < 0.92 ):
+            control = rng.choice( ( padsim.xy_x, padsim.xy_y, padsim.xy_touch ) )
+            value = rng.choice( ( 0, 127 ) ) if control == padsim.xy_touch else rng.randint( 0, 127 )
+            events.append( ( 'msg', pad, padsim.xy_msg( control, value ), ) )
+        elif ( roll < 0.96 ):
+            toggle = rng.choice( ( 'sustain', 'latch' ) )
+            toggled[toggle] = not toggled[toggle]
+            events.append( ( toggle, ) )
+        else:
+            change = rng.choice( ( 'key', 'layout', 'top' ) )
+            if ( change == 'key' ):
+                events.append( ( 'config', random_key( rng ), ) )
+            elif ( change == 'layout' ):
+                events.append( ( 'config', dict( note_layout=rng.choice( builtin_layouts + tuple( layouts ) ) ), ) )
+            else:
+                events.append( ( 'config', dict( top=rng.randint( 0, 1 ) ), ) )
+    for pad, note in sorted( held ):
+        events.append( ( 'msg', pad, mido.Message( 'note_off', channel=1, note=note, velocity=64 ), ) )
+    for toggle in sorted( toggled ):
+        if ( toggled[toggle] ):
+            events.append( ( toggle, ) )
+    return ( settings, events, layouts, )
+
+def run_reference(settings, events):
+    ref = Reference( **settings )
+    elapsed = 0
+    for event in events:
+        if ( event[0] == 'msg' ):
+            start = time.perf_counter()
+            ref.play( event[1], event[2] )
+            elapsed += time.perf_counter() - start
+        elif ( event[0] == 'config' ):
+            ref.configure( **event[1] )
+        elif ( event[0] == 'sustain' ):
+            ref.toggle_sustain()
+        else:
+            ref.toggle_latch()
+    return ( { name: [ flatten(msg) for msg in sent ] for name, sent in ref.out.items() }, elapsed, )
+
+def reset(pad):
+    '''back to nothing sounding, sustain and latch off and fresh MPE channel order -
+    a shrunk scenario can stop anywhere'''
+    if ( pad.sustain_on ):
+        pad.sustain()
+    if ( pad.latch_on ):
+        pad.latch()
+    pad.panic()
+    for alloc in pad.mpe.values():
+        alloc.__init__( alloc.channels )
+
+def run_optimized(pad, settings, events):
+    '''plays the events through handle_msgs, on this thread so the order is deterministic'''
+    pad.reconfigure( **settings )
+    for port in padsim.outputs.values():
+        port.sent = []
+    elapsed = 0
+    for event in events:
+        if ( event[0] == 'msg' ):
+            start = time.perf_counter()
+            pad.handle_msgs( event[2], event[1] )
+            elapsed += time.perf_counter() - start
+        elif ( event[0] == 'config' ):
+            pad.reconfigure( **event[1] )
+        elif ( event[0] == 'sustain' ):
+            pad.sustain()
+        else:
+            pad.latch()
+        pad.flush_out()
+    out = { name: [ flatten(msg) for msg in port.sent ] for name, port in padsim.outputs.items() if port.sent }
+    return ( out, elapsed, )
+
+def first_difference(expected, got):
+    for port in sorted( set( expected ) | set( got ) ):
+        a = expected.get( port, [] )
+        b = got.get( port, [] )
+        for n in range( 0, max( len(a), len(b) ) ):
+            if ( n >= len(a) or n >= len(b) or a[n] != b[n] ):
+                return { 'port':port, 'index':n, 'expected':a[n] if n < len(a) else None, 'got':b[n] if n < len(b) else None }
+    return None
+
+def check(pad, settings, events, layouts):
+    '''play a scenario through both paths - its layouts are only in Layouts.notes meanwhile'''
+    Layouts.notes.update( layouts )
+    try:
+        expected, ref_time = run_reference( settings, events )
+        got, opt_time = run_optimized( pad, settings, events )
+    finally:
+        reset( pad ) # while the scenario's layouts still exist - latch() rebuilds the padmaps
+        for name in layouts:
+            del Layouts.notes[name]
+    return ( first_difference( expected, got ), ref_time, opt_time, )
+
+def shrink(pad, settings, events, layouts):
+    '''shortest failing prefix of events'''
+    low, high = 1, len( events )
+    while ( low < high ):
+        middle = ( low + high ) // 2
+        if ( check( pad, settings, events[:middle], layouts )[0] ):
+            high = middle
+        else:
+            low = middle + 1
+    return events[:high]
+
+def main():
+    parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+    parser.add_argument( '--scenarios', type=int, default=200 )
+    parser.add_argument( '--events', type=int, default=400, help='events per scenario' )
+    parser.add_argument( '--seed', type=int, default=1, help='seed of the first scenario' )
+    parser.add_argument( '--json', help='write the report here' )
+    parser.add_argument( '--quiet', action='store_true', help='only print failures and the summary' )
+    args = parser.parse_args()
+
+    logging.basicConfig( level="WARNING", format='%(levelname)s - %(message)s' )
+    pad = padstrument.Padstrument( backend='padsim' )
+
+    results = []
+    failures = 0
+    for seed in range( args.seed, args.seed + args.scenarios ):
+        settings, events, layouts = scenario( seed, args.events )
+        difference, ref_time, opt_time = check( pad, settings, events, layouts )
+        result = dict( seed=seed, events=len( events ), ok=difference is None,
+            reference_ms=round( ref_time*1000, 3 ), optimized_ms=round( opt_time*1000, 3 ),
+            speedup=round( ref_time / opt_time, 2 ) if opt_time else None, **settings )
+        if ( difference ):
+            failures += 1
+            prefix = shrink( pad, settings, events, layouts )
+            result['difference'] = check( pad, settings, prefix, layouts )[0]
+            result['failing_prefix'] = [ repr( event ) for event in prefix ]
+            print( "FAIL seed %i: %s" % ( seed, result['difference'] ) )
+        elif ( not args.quiet ):
+            print( "ok   seed %-6i %-12s %-5s %2i %i %-6s top %i  ref %8.3f ms  opt %8.3f ms  x%.2f" % ( seed,
+                settings['note_layout'], settings['scale'], settings['tonic'], settings['mode'],
+                settings['zone_map'], settings['top'], result['reference_ms'], result['optimized_ms'], result['speedup'] ) )
+        results.append( result )
+
+    speedups = sorted( result['speedup'] for result in results if result['speedup'] )
+    summary = dict( scenarios=len( results ), failures=failures,
+        median_speedup=speedups[ len(speedups)//2 ] if speedups else None,
+        reference_ms=round( sum( r['reference_ms'] for r in results ), 3 ),
+        optimized_ms=round( sum( r['optimized_ms'] for r in results ), 3 ) )
+    print( json.dumps( summary ) )
+    if ( args.json ):
+        with open( args.json, 'w' ) as f:
+            json.dump( dict( summary=summary, scenarios=results ), f, indent=2 )
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit( main() )
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+'''simulated nanoPAD2 backend for mido - runs a Padstrument without hardware
+
+    pad = Padstrument( backend='padsim' )
+    padsim.pads[0].inject( mido.Message('note_on', channel=1, note=64, velocity=100) )
+    padsim.outputs['padstrument_out'].sent   # everything the instrument played
+
+Each simulated nanoPAD answers the sysex Padstrument sends when connecting, and delivers
+injected messages to the port callback from a thread of its own, like rtmidi does.
+Injected messages queue up until the callback thread gets to them, so the queue depth and
+the time from inject() to the end of the callback show how far behind the instrument is.
+Like a real midi input buffer the queue holds queue_size messages - inject() drops what
+doesn't fit, and counts it in the port's dropped.
+'''
+import mido, time, threading, queue
+from mido.ports import BaseIOPort, BaseOutput
+
+devices = 2     # number of simulated nanoPADs - set before opening ports
+pads = {}       # open simulated nanoPADs - number: NanoPAD
+outputs = {}    # open output ports - name: Output
+queue_size = 1024   # input buffer of each simulated nanoPAD, in messages - set before opening ports
+
+syx_search = [ 0x42, 0x50, 0x00, 0x00 ]
+
+# native mode X-Y pad CCs, sent on channel 15
+xy_x = 9
+xy_y = 10
+xy_touch = 11
+
+def xy_msg(control, value):
+    '''a native mode X-Y pad message - control is xy_x, xy_y or xy_touch'''
+    return mido.Message( 'control_change', channel=15, control=control, value=value )
+
+# native mode Touch Scale - notes and Y axis CC 2, on channel 2
+touch_scale_channel = 2
+
+def touch_scale_msg(note, on=True):
+    '''a native mode Touch Scale note on/off - any note number'''
+    if ( on ):
+        return mido.Message( 'note_on', channel=touch_scale_channel, note=note, velocity=127 )
+    return mido.Message( 'note_off', channel=touch_scale_channel, note=note, velocity=64 )
+
+def get_devices(**kwargs):
+    '''mido backend hook - the simulated nanoPADs, plus any open output ports'''
+    devs = [ dict( name='nanoPAD2 '+str(num)+' PAD', is_input=True, is_output=True ) for num in range(0, devices) ]
+    devs += [ dict( name=name, is_input=False, is_output=True ) for name in outputs ]
+    return devs
+
+def reset():
+    '''forget all ports - call between runs'''
+    for port in list( pads.values() ):
+        port.close()
+    pads.clear()
+    outputs.clear()
+
+
+class NanoPAD(BaseIOPort):
+    '''a simulated nanoPAD2'''
+
+    def _open(self, callback=None, **kwargs):
+        self.num = int( self.name.split()[1] )
+        self.channel = self.num # global midi channel, reported in the device search reply
+        self.callback = callback
+        self.queue = queue.Queue( maxsize=queue_size )
+        self.dropped = 0        # injected messages that didn't fit in the queue
+        self.lock = threading.Lock()
+        self.sent = []          # messages the instrument sent to this pad (leds, sysex)
+        self.delivered = 0      # messages handed to the callback
+        self.latency = []       # seconds from inject() to the end of each callback
+        self.errors = []        # exceptions raised by the callback
+        self.record_latency = True
+        self.thread = threading.Thread( target=self.run, name=self.name, daemon=True )
+        self.thread.start()
+        pads[self.num] = self
+
+    def _close(self):
+        self.queue.put( (0, None,) )
+        pads.pop( self.num, None )
+
+    def _send(self, msg):
+        self.sent.append( msg )
+        if ( msg.type == "sysex" ):
+            if ( list( msg.data ) == syx_search ):
+                # device search reply - data[3] is the pad's channel
+                reply = [ 0x42, 0x50, 0x01, self.channel, 0x00, 0x12, 0x01, 0x00, 0x00, 0x01, 0x00, 0x01, 0x00 ]
+            else:
+                # ack any other command
+                reply = [ 0x42, 0x40 + self.channel, 0x00, 0x01, 0x12, 0x00, 0x23, 0x00 ]
+            self.inject( mido.Message( 'sysex', data=reply ) )
+
+    def inject(self, msg):
+        '''queue a message as if the pad had sent it.  returns False if the queue was full and the
+        message was dropped'''
+        try:
+            self.queue.put_nowait( ( time.perf_counter(), msg, ) )
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def touch_xy(self, x, y):
+        '''touch the X-Y pad at x, y (0-127), as the pad does in native mode'''
+        self.inject( xy_msg( xy_touch, 127 ) )
+        self.inject( xy_msg( xy_x, x ) )
+        self.inject( xy_msg( xy_y, y ) )
+
+    def release_xy(self):
+        '''let go of the X-Y pad'''
+        self.inject( xy_msg( xy_touch, 0 ) )
+
+    def depth(self):
+        '''number of messages waiting for the callback'''
+        return self.queue.qsize()
+
+    def drain(self):
+        '''wait until every injected message has been through the callback'''
+        self.queue.join()
+
+    def run(self):
+        '''callback thread - hands queued messages to the port callback in order'''
+        while True:
+            stamp, msg = self.queue.get()
+            if ( msg is None ):
+                self.queue.task_done()
+                return
+            try:
+                if ( self.callback ):
+                    self.callback( msg )
+            except Exception as e:
+                self.errors.append( e )
+            self.delivered += 1
+            if ( self.record_latency ):
+                self.latency.append( time.perf_counter() - stamp )
+            self.queue.task_done()
+
+IOPort = NanoPAD
+
+
+class Output(BaseOutput):
+    '''a simulated output port - records what was sent'''
+
+    def _open(self, **kwargs):
+        self.sent = []
+        outputs[self.name] = self
+
+    def _send(self, msg):
+        self.sent.append( msg )
@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+'''stress test - finds where the engine breaks
+
+Drives a Padstrument on the simulated nanoPADs in padsim at increasing message rates.
+Each rate step runs for --step-seconds with --devices virtual players, split over the two
+pads, playing what a nanoPAD2 sends in native mode - trigger pad notes, X-Y pad touches and
+moves, Touch Scale notes and SCENE presses.  Meanwhile a key changer reconfigures the key mid
+stream, the way the settings buttons and the remote do.
+
+For every step it records offered and handled rates, input queue depth over time, callback
+latency (inject to end of callback, so queueing is included), dropped messages (the pads'
+input queues hold --queue-size messages, like a real midi input buffer, and drop what doesn't
+fit), callback errors and stuck notes (note ons left without a note off once every player has
+let go).  The saturation point is the first rate the engine can't keep up with, the onset of
+queue growth the first rate where the input queues grow through the step, and the drop rate
+the first rate where they overflow.
+
+    ./padstress.py                            # report to stdout
+    ./padstress.py --zone-map mpe --out stress.json
+
+The report is JSON, for tracking regressions across versions.  The exit status is 1 if any
+step dropped messages, raised errors or left stuck notes.
+
+The players run in this process, so at high rates they compete with the callbacks for the
+interpreter - treat the saturation point as a relative number, for comparing versions.
+'''
+import argparse, json, logging, os, platform, random, statistics, subprocess, sys, threading, time
+import mido, padsim, padstrument
+
+here = os.path.dirname( os.path.abspath(__file__) )
+pad_notes = list( range( 64, 80 ) ) # notes a nanoPAD2 sends
+
+
+class Player(threading.Thread):
+    '''a virtual player on one simulated nanoPAD.
+    Players on the same pad get their own notes, so no pad is pressed twice at once.'''
+
+    def __init__(self, port, notes, rate, seed, stop, scene=False):
+        threading.Thread.__init__( self, daemon=True )
+        self.port = port
+        self.notes = notes
+        self.interval = 1.0 / rate
+        self.rng = random.Random( seed )
+        self.stop = stop
+        self.scene = scene      # only players on one pad press SCENE - both together toggles profiling
+        self.held = set()
+        self.touch_scale = set() # Touch Scale notes held
+        self.touching = False   # X-Y pad touched
+        self.scene_down = False
+        self.injected = 0
+
+        # prebuilt messages, so injecting costs next to nothing
+        self.note_on = { note: mido.Message( 'note_on', channel=1, note=note, velocity=100 ) for note in notes }
+        self.note_off = { note: mido.Message( 'note_off', channel=1, note=note, velocity=64 ) for note in notes }
+        self.xy = [ padsim.xy_msg( control, value ) for control in ( padsim.xy_x, padsim.xy_y ) for value in range( 0, 128, 8 ) ]
+        self.touch_msgs = ( padsim.xy_msg( padsim.xy_touch, 0 ), padsim.xy_msg( padsim.xy_touch, 127 ) )
+        self.touch_scale_on = [ padsim.touch_scale_msg( note, True ) for note in range( 0, 128 ) ]
+        self.touch_scale_off = [ padsim.touch_scale_msg( note, False ) for note in range( 0, 128 ) ]
+        self.scene_msgs = ( mido.Message( 'control_change', channel=15, control=57, value=0 ),
+            mido.Message( 'control_change', channel=15, control=57, value=127 ) )
+
+    def inject(self, msg):
+        self.port.inject( msg )
+        self.injected += 1
+
+    def next_msg(self):
+        roll = self.rng.random()
+        if ( roll < 0.6 ):
+            note = self.rng.choice( self.notes )
+            if ( note in self.held ):
+                self.held.discard( note )
+                return self.note_off[note]
+            self.held.add( note )
+            return self.note_on[note]
+        if ( roll < 0.85 ):
+            if ( not self.touching ):
+                self.touching = True
+                return self.touch_msgs[1]
+            return self.rng.choice( self.xy )
+        if ( roll < 0.88 and self.touching ):
+            self.touching = False
+            return self.touch_msgs[0]
+        if ( roll < 0.97 or not self.scene ):
+            note = self.rng.randrange( 0, 128 )
+            if ( note in self.touch_scale ):
+                self.touch_scale.discard( note )
+                return self.touch_scale_off[note]
+            self.touch_scale.add( note )
+            return self.touch_scale_on[note]
+        self.scene_down = not self.scene_down
+        return self.scene_msgs[ self.scene_down ]
+
+    def run(self):
+        due = time.perf_counter()
+        while ( not self.stop.is_set() ):
+            now = time.perf_counter()
+            if ( now < due ):
+                time.sleep( min( due - now, 0.001 ) )
+                continue
+            while ( due <= now ):
+                self.inject( self.next_msg() )
+                due += self.interval
+
+    def release(self):
+        '''let go of everything'''
+        for note in sorted( self.held ):
+            self.inject( self.note_off[note] )
+        self.held.clear()
+        for note in sorted( self.touch_scale ):
+            self.inject( self.touch_scale_off[note] )
+        self.touch_scale.clear()
+        if ( self.touching ):
+            self.inject( self.touch_msgs[0] )
+            self.touching = False
+        if ( self.scene_down ):
+            self.inject( self.scene_msgs[0] )
+            self.scene_down = False
+
+
+class KeyChanger(threading.Thread):
+    '''changes key mid stream through Padstrument.reconfigure()'''
+
+    def __init__(self, pad, rate, seed, stop):
+        threading.Thread.__init__( self, daemon=True )
+        self.pad = pad
+        self.interval = 1.0 / rate if rate else 0
+        self.rng = random.Random( seed )
+        self.stop = stop
+        self.changes = 0
+
+    def run(self):
+        if ( not self.interval ):
+            return
+        while ( not self.stop.wait( self.interval ) ):
+            self.pad.reconfigure( tonic=self.rng.randrange( 0, 12 ), mode=self.rng.randrange( 1, 8 ) )
+            self.changes += 1
+
+
+def depth():
+    return sum( port.depth() for port in padsim.pads.values() )
+
+def percentiles(samples):
+    if ( not samples ):
+        return {}
+    samples = sorted( samples )
+    n = len( samples )
+    return { 'p'+str(point): round( samples[ min( n-1, (n*point)//100 ) ] * 1000, 4 ) for point in (50, 90, 99, 100) }
+
+def stuck_notes():
+    '''(port, channel, note) of every note on in the output streams without a later note off'''
+    sounding = set()
+    for name, port in padsim.outputs.items():
+        for msg in port.sent:
+            if ( msg.type == "note_on" and msg.velocity > 0 ):
+                sounding.add( ( name, msg.channel, msg.note, ) )
+            elif ( msg.type == "note_off" or msg.type == "note_on" ):
+                sounding.discard( ( name, msg.channel, msg.note, ) )
+    return sorted( sounding )
+
+def settle(pad):
+    '''wait for the queues to empty, then turn off sustain and latch so their notes are released'''
+    for port in padsim.pads.values():
+        port.drain()
+    if ( pad.sustain_on ):
+        pad.sustain()
+    if ( pad.latch_on ):
+        pad.latch()
+    pad.flush_out()
+
+def run_step(pad, rate, args, seed):
+    '''run one rate step, returns its part of the report'''
+    ports = padsim.pads
+    for port in ports.values():
+        port.latency = []
+    for port in padsim.outputs.values():
+        port.sent = []
+    delivered = sum( port.delivered for port in ports.values() )
+    dropped = sum( port.dropped for port in ports.values() )
+    errors = sum( len( port.errors ) for port in ports.values() )
+
+    stop = threading.Event()
+    players = []
+    for num in range( 0, args.devices ):
+        side = num % 2
+        notes = pad_notes[ num // 2 :: ( args.devices + 1 ) // 2 ]
+        players.append( Player( ports[side], notes, rate / args.devices, seed+num, stop, scene=( side == 0 ) ) )
+    keys = KeyChanger( pad, args.key_rate, seed, stop )
+
+    samples = []
+    start = time.perf_counter()
+    for thread in players + [ keys ]:
+        thread.start()
+    while ( time.perf_counter() - start < args.step_seconds ):
+        samples.append( ( time.perf_counter() - start, depth() ) )
+        time.sleep( 0.01 )
+    stop.set()
+    for thread in players + [ keys ]:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    handled = sum( port.delivered for port in ports.values() ) - delivered
+    offered = sum( player.injected for player in players ) # before letting go
+
+    # catch up, let go and check the books - the players let go once the queues have room,
+    # so their note offs aren't dropped
+    end_queue = depth()
+    drain_start = time.perf_counter()
+    for port in ports.values():
+        port.drain()
+    for player in players:
+        player.release()
+    settle( pad )
+    drain = time.perf_counter() - drain_start
+    injected = sum( player.injected for player in players )
+    total = sum( port.delivered for port in ports.values() ) - delivered
+
+    slope = statistics.linear_regression( [ t for t, d in samples ], [ d for t, d in samples ] ).slope if len( samples ) > 2 else 0
+    latency = []
+    for port in ports.values():
+        latency += port.latency
+    stuck = stuck_notes()
+
+    return {
+        'rate': rate,
+        'offered': round( offered / elapsed, 1 ),
+        'handled': round( handled / elapsed, 1 ),
+        'injected': injected,
+        'delivered': total,
+        'dropped': sum( port.dropped for port in ports.values() ) - dropped,
+        'errors': sum( len( port.errors ) for port in ports.values() ) - errors,
+        'max_queue': max( d for t, d in samples ),
+        'end_queue': end_queue,
+        'queue_slope': round( slope, 1 ),
+        'queue_growth': slope > rate * 0.01,
+        'latency_ms': percentiles( latency ),
+        'drain_ms': round( drain * 1000, 2 ),
+        'key_changes': keys.changes,
+        'stuck_notes': [ list(note) for note in stuck ],
+        }
+
+def version():
+    try:
+        return subprocess.run( [ 'git', 'describe', '--always', '--dirty' ], cwd=here,
+            capture_output=True, text=True, check=True ).stdout.strip()
+    except ( OSError, subprocess.CalledProcessError ):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+    parser.add_argument( '--devices', type=int, default=8, help='virtual players, split over the two pads' )
+    parser.add_argument( '--start-rate', type=float, default=500, help='messages per second of the first step' )
+    parser.add_argument( '--max-rate', type=float, default=64000, help='stop ramping past this rate' )
+    parser.add_argument( '--factor', type=float, default=2, help='rate multiplier between steps' )
+    parser.add_argument( '--step-seconds', type=float, default=2, help='length of each step' )
+    parser.add_argument( '--past-saturation', type=int, default=1, help='steps to run after saturating' )
+    parser.add_argument( '--key-rate', type=float, default=4, help='key changes per second, 0 for none' )
+    parser.add_argument( '--zone-map', default='single', help='Zones map to play through' )
+    parser.add_argument( '--queue-size', type=int, default=padsim.queue_size, help='input queue of each pad, in messages' )
+    parser.add_argument( '--seed', type=int, default=1 )
+    parser.add_argument( '--out', help='write the report here instead of stdout' )
+    args = parser.parse_args()
+
+    logging.basicConfig( level="WARNING", format='%(levelname)s - %(message)s' )
+    padstrument.Padstrument.def_zone_map = args.zone_map
+    padsim.queue_size = args.queue_size
+    pad = padstrument.Padstrument( backend='padsim' )
+    for port in padsim.pads.values():
+        port.inject( mido.Message( 'note_off', channel=1, note=64, velocity=64 ) ) # warm up
+    settle( pad )
+
+    report = {
+        'tool': 'padstress',
+        'version': version(),
+        'python': platform.python_version(),
+        'mido': str( mido.version_info ),
+        'started': time.strftime( '%Y-%m-%dT%H:%M:%S' ),
+        'settings': vars( args ),
+        'steps': [],
+        }
+
+    rate = args.start_rate
+    saturation = None
+    growth = None
+    drops = None
+    past = 0
+    while ( rate <= args.max_rate ):
+        step = run_step( pad, rate, args, args.seed + len( report['steps'] ) * 100 )
+        report['steps'].append( step )
+        logging.warning( "rate %i: handled %.1f/s, max queue %i, p99 %s ms, stuck %i, dropped %i",
+            rate, step['handled'], step['max_queue'], step['latency_ms'].get('p99'), len( step['stuck_notes'] ), step['dropped'] )
+        if ( growth is None and step['queue_growth'] ):
+            growth = rate
+        if ( drops is None and step['dropped'] ):
+            drops = rate
+        if ( saturation is None and step['handled'] < step['offered'] * 0.95 ):
+            saturation = rate
+        if ( saturation is not None ):
+            past += 1
+            if ( past > args.past_saturation ):
+                break
+        rate *= args.factor
+
+    report['saturation_rate'] = saturation
+    report['queue_growth_rate'] = growth
+    report['drop_rate'] = drops
+    report['max_handled'] = max( step['handled'] for step in report['steps'] )
+    report['stuck_notes'] = sum( len( step['stuck_notes'] ) for step in report['steps'] )
+    report['dropped'] = sum( step['dropped'] for step in report['steps'] )
+    report['errors'] = sum( step['errors'] for step in report['steps'] )
+
+    text = json.dumps( report, indent=2 )
+    if ( args.out ):
+        with open( args.out, 'w' ) as f:
+            f.write( text+'\n' )
+    else:
+        print( text )
+    return 1 if ( report['stuck_notes'] or report['dropped'] or report['errors'] ) else 0
+
+if __name__ == "__main__":
+    sys.exit( main() )
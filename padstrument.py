@@ -1,9 +1,6 @@
 #!/usr/bin/python3
-import mido, logging, time
-from threading import Timer
-
-# set up logging  - 50 CRITICAL 40 ERROR 30 WARNING 20 INFO 10 DEBUG 0 NOTSET
-logging.basicConfig(level="DEBUG",  format='%(levelname)s - %(message)s')
+import mido, logging, time, os, sys, json, socket, selectors, struct, io
+from threading import Timer, Event, Lock, Thread, local
 
 # Global reference vars - notelookups
 C=0; Db=Cs=1; D=2; Eb=Ds=3; E=4; F=5; Gb=Fs=6; G=7; Ab=Gs=8; A=9; Bb=As=10; B=11;
@@ -33,12 +30,21 @@ class Translate:
         list( range( 71, 63, -1 ) )
         ]
 
-    # generate note2grid maps
-    note2grid_map = { "top":{}, "bottom":{} }
-    for row in range (0,2):
-        for col in range (0,8):
-            note2grid_map['top'][ grid2note_map[row][col] ] = (row, row, col,)
-            note2grid_map['bottom'][ grid2note_map[row+2][col] ] = (row+2, row, col,)
+    note2grid_map = False # generated on first use - see note2grid()
+
+    @classmethod
+    def note2grid(cls, note, side="top"):
+        '''takes a nanopad note and "top" or "bottom", and returns a tuple
+        (grid_row, row, col,) - grid_row in the 4x8 grid, row in the 2x8 nanopad grid
+        '''
+        if ( not cls.note2grid_map ):
+            note2grid_map = { "top":{}, "bottom":{} }
+            for row in range (0,2):
+                for col in range (0,8):
+                    note2grid_map['top'][ cls.grid2note_map[row][col] ] = (row, row, col,)
+                    note2grid_map['bottom'][ cls.grid2note_map[row+2][col] ] = (row+2, row, col,)
+            cls.note2grid_map = note2grid_map
+        return cls.note2grid_map[side].get( note, False )
 
     @classmethod
     def coord_exists(cls, row, col):
@@ -111,7 +117,7 @@ class Layouts:
     KWARGS allows passing arbitrary info with the layout
     NOTES( scale_degree (1-7), group(1-4), (KWARGS)  )
     scale_degree can go up or down past 1-7 as desired
-    offsets will be translated into higher or lower notes, following the 1-7 scale degree thing
+    offsets will be translated into higher or lower notes by Scales, whatever the length of the scale
     4 x 4 layouts - split vertically
 
     4x4 layouts provide one model, which can be rotated and flipped. (TODO)
@@ -140,42 +146,36 @@ class Layouts:
             [ (N,N,), (N,N,), (N,N,), (N,N,), (N,N,), (N,N,), (N,N,), (N,N,) ]
             ]
 
-    buttons['bs0'] = [
-            [ ('s4','s4',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s3','s3',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s2','s2',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s1','s1',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ]
-            ]
-
-    buttons['bs1'] = [
-            [ ('s4','s4',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s3','s3',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s2','s2',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s1','s1',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ]
+    # every pad latches - tap on, tap off
+    L = "latchnote"
+    buttons['latch'] = [
+            [ (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,) ],
+            [ (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,) ],
+            [ (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,) ],
+            [ (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,), (L,F,) ]
             ]
 
-    buttons['bs2'] = [
-            [ ('s4','s4',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
+    SU = "sustain" # toggles global sustain
+    LA = "latch" # toggles latch play layout
+    PA = "panic" # all notes off
+    buttons['bs0'] = [
+            [ ('s4','s4',), (SU,F,), (LA,F,), (PA,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
             [ ('s3','s3',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
             [ ('s2','s2',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
             [ ('s1','s1',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ]
             ]
 
-    buttons['bs3'] = [
-            [ ('s4','s4',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s3','s3',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s2','s2',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
-            [ ('s1','s1',), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ]
-            ]
+    # blank settings pages - only the s1-s4 page buttons, generated on first use
+    blank_pages = { 'bs1':'bs0', 'bs2':'bs0', 'bs3':'bs0', 'ts1':'ts0', 'ts2':'ts0', 'ts3':'ts0', 'ts4':'ts0' }
 
     T = "set_tonic" # (T,notenum,)
     CC = "set_C_major"
-    S = "set_scale" # (S,'harm' or 'nat',)
+    S = "set_scale" # (S,scale family - see Scales.families,)
     M = "set_mode" # (M, modenum 1-7)
     buttons['bs4'] = [
             [ ('s4','s4',), ((T,1,),F,), ((T,3,),F,), (F,F,), ((T,6,),F,), ((T,8,),F,), ((T,10,),F,), (CC,F,) ],
             [ ('s3','s3',), ((T,0,),F,), ((T,2,),F,), ((T,4,),F,), ((T,5,),F,), ((T,7,),F,), ((T,9,),F,), ((T,11,),F,) ],
-            [ ('s2','s2',), ((S,'nat',),F,), ((S,'harm',),F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,) ],
+            [ ('s2','s2',), ((S,'nat',),F,), ((S,'harm',),F,), ((S,'mel',),F,), ((S,'penta',),F,), ((S,'blues',),F,), ((S,'hira',),F,), (F,F,) ],
             [ ('s1','s1',), ((M,1,),F,), ((M,2,),F,), ((M,3,),F,), ((M,4,),F,), ((M,5,),F,), ((M,6,),F,), ((M,7,),F,) ]
             ]
 
@@ -183,41 +183,12 @@ class Layouts:
 
 
     buttons['ts0'] = [
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s1','s1',) ],
+            [ (SU,F,), (LA,F,), (PA,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s1','s1',) ],
             [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s2','s2',) ],
             [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s3','s3',) ],
             [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s4','s4',) ]
             ]
 
-    buttons['ts1'] = [
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s1','s1',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s2','s2',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s3','s3',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s4','s4',) ]
-            ]
-
-    buttons['ts2'] = [
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s1','s1',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s2','s2',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s3','s3',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s4','s4',) ]
-            ]
-
-    buttons['ts3'] = [
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s1','s1',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s2','s2',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s3','s3',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s4','s4',) ]
-            ]
-
-    buttons['ts4'] = [
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s1','s1',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s2','s2',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s3','s3',) ],
-            [ (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), (F,F,), ('s4','s4',) ]
-            ]
-
-
     # full size note layouts - can be applied directly without
     # having to be assembled from layout pieces
 
@@ -248,10 +219,19 @@ class Layouts:
         '''return True if mode exists, raise exception if not'''
         if ( mode in cls.buttons ):
             return cls.buttons[mode]
+        elif ( mode in cls.blank_pages ):
+            cls.buttons[mode] = cls.make_blank_page( cls.blank_pages[mode] )
+            return cls.buttons[mode]
         else:
             raise Exception( "Layout Error: Button mode "+str(mode)+" does not exist" )
             return False
 
+    @classmethod
+    def make_blank_page( cls, like ):
+        '''returns a settings page with the s1-s4 page buttons of page "like" and nothing else'''
+        F = False
+        return [ [ button if button[0] in ('s1','s2','s3','s4') else (F,F,) for button in row ] for row in cls.buttons[like] ]
+
     @classmethod
     def note_layout_exists( cls, name ):
         '''return True if mode exists, raise exception if not'''
@@ -364,10 +344,10 @@ class Layouts:
                 onpress_args = False
 
             if ( type(button[1]).__name__ == "tuple" ):
-                onrelease = button[0][0]
-                onrelease_args = button[0][1]
+                onrelease = button[1][0]
+                onrelease_args = button[1][1]
             else:
-                onrelease = button[0]
+                onrelease = button[1]
                 onrelease_args = False
 
             return (onpress, onpress_args, onrelease, onrelease_args,)
@@ -378,104 +358,240 @@ class Layouts:
     def get_note( cls, row, col, name=False ):
         '''returns a tuple containing all the settings for a button
         (degree, octave) - each element is an int or False
+        degrees outside the scale are left alone - Scales wraps them into octaves
         '''
         name = name if name else cls.current_note_layout
         if ( cls.note_layout_exists(name) and cls.coord_exists(row,col) ):
-            # get note and octave, deal with notes above 7
-            note = cls.notes[name][row][col][0] % 8
-            octave = cls.notes[name][row][col][1] + ( cls.notes[name][row][col][0] // 8 )
+            note = cls.notes[name][row][col][0]
+            octave = cls.notes[name][row][col][1]
 
             return (note, octave,)
         else:
             return False
 
 
+class Zones:
+    '''zones split the 4x8 grid into regions, each with its own output routing
+    zone maps are multidimensional (4x8) lists of zone names - a cell can also hold a
+    tuple of zone names to layer several zones on one button.
+
+    zone settings:
+    port - name of the (virtual) output port the zone plays through
+    channel - midi channel (0-15) of the zone
+    transpose - semitones added to every note the zone plays
+    mpe - number of MPE member channels (0 = off).  MPE zones play every held note on its
+          own member channel (lower zone - manager channel 0, members 1-n), and ignore channel.
+          zones sharing a port share its member channels.
+
+    routing is compiled into the padmaps by Padstrument.make_padmaps(), so at runtime
+    a pad already knows every (port, channel, note, allocator) it plays - zone selection costs nothing.
+    '''
+
+    current_zone_map = "single"
+
+    zones = {}
+    maps = {}
+
+    zones['all'] = Bunch( port="padstrument_out", channel=1, transpose=0, mpe=0 )
+    zones['bass'] = Bunch( port="padstrument_bass", channel=0, transpose=-12, mpe=0 )
+    zones['lead'] = Bunch( port="padstrument_lead", channel=0, transpose=0, mpe=0 )
+    zones['mpe'] = Bunch( port="padstrument_mpe", channel=0, transpose=0, mpe=15 )
+
+    A = 'all'
+    maps['single'] = [
+            [ A, A, A, A, A, A, A, A ],
+            [ A, A, A, A, A, A, A, A ],
+            [ A, A, A, A, A, A, A, A ],
+            [ A, A, A, A, A, A, A, A ]
+            ]
+
+    # top pad plays bass, bottom pad plays lead
+    BS = 'bass'
+    LD = 'lead'
+    maps['split'] = [
+            [ BS, BS, BS, BS, BS, BS, BS, BS ],
+            [ BS, BS, BS, BS, BS, BS, BS, BS ],
+            [ LD, LD, LD, LD, LD, LD, LD, LD ],
+            [ LD, LD, LD, LD, LD, LD, LD, LD ]
+            ]
+
+    # every held pad on its own channel, for expressive synths
+    MP = 'mpe'
+    maps['mpe'] = [
+            [ MP, MP, MP, MP, MP, MP, MP, MP ],
+            [ MP, MP, MP, MP, MP, MP, MP, MP ],
+            [ MP, MP, MP, MP, MP, MP, MP, MP ],
+            [ MP, MP, MP, MP, MP, MP, MP, MP ]
+            ]
+
+    @classmethod
+    def zone_exists( cls, name ):
+        '''return zone settings if zone exists, raise exception if not'''
+        if ( name in cls.zones ):
+            return cls.zones[name]
+        else:
+            raise Exception( "Zone Error: Zone "+str(name)+" does not exist" )
+            return False
+
+    @classmethod
+    def zone_map_exists( cls, name ):
+        '''return zone map if it exists, raise exception if not'''
+        if ( name in cls.maps ):
+            return cls.maps[name]
+        else:
+            raise Exception( "Zone Error: Zone map "+str(name)+" does not exist" )
+            return False
+
+    @classmethod
+    def set_zone_map( cls, name ):
+        '''sets the current zone map
+        '''
+        if ( cls.zone_map_exists(name) ):
+            cls.current_zone_map = name
+            return True
+        else:
+            return False
+
+    @classmethod
+    def get_zones( cls, row, col, name=False ):
+        '''returns a tuple containing the settings Bunch of every zone
+        the button at row/col belongs to
+        '''
+        name = name if name else cls.current_zone_map
+        if ( cls.zone_map_exists(name) and Layouts.coord_exists(row,col) ):
+            cell = cls.maps[name][row][col]
+            names = cell if type(cell).__name__ == "tuple" else (cell,)
+            return tuple( cls.zone_exists(zone) for zone in names )
+        else:
+            return False
+
+    @classmethod
+    def get_ports( cls, name=False ):
+        '''returns a list of the output port names used by a zone map, in grid order'''
+        ports = []
+        for row in range (0,4):
+            for col in range (0,8):
+                for zone in cls.get_zones( row, col, name ):
+                    if ( zone.port not in ports ):
+                        ports.append( zone.port )
+        return ports
+
+
 class Scales:
+    '''table driven scale engine
+
+    Scales are interval sets (semitones above the tonic) of any length.  Each family's
+    interval set is rotated into one scale per mode - mode n starts on the family's nth degree,
+    so modes are parallel (every mode of C starts on C).  All scales are compiled into one flat
+    integer table, indexed by [scale][tonic][degree]:
+        table[ base[scale] + tonic*length[scale] + degree ]
+    The table is generated once, on first use, and shared by all layouts.
+    Degrees are 1 based and can go past either end of the scale - they wrap into
+    the octaves above and below.
+    '''
 
     # settable class variables
     tonic = 0 # key root note - defaults to C
     mode = 1 # 1 based - will also accept mode names
-    type = 'nat' # 'nat' or 'harm' for natural or harmonic minor scales as a basis for the mode calculations.
+    type = 'nat' # scale family the modes are taken from - see families
 
-    # generate scales
     circle_5 = [C,G,D,A,E,B,Fs,Db,Ab,Eb,Bb,F]
     circle_m = [A,E,B,Fs,Cs,Gs,Eb,Bb,F,C,G,D] # minor scales - the inner wheel Aeolian stuff.  Used for navigation buttons to move around the circle to change key.
     circle_5ths = circle_5 + circle_5 # create a threepeat circle of fifths.  slice it to get scales.
 
-    temp = [ ]
-    for x in range(0,7):
-        temp.append( circle_5ths[12-x:19-x] )
-        temp[x].sort()
-
-    # generate modes of C
-    scaler = Bunch()
-    scaler['nat'] = Bunch()
-    scaler['nat'][C] = Bunch()
-    scaler['nat'][C]['ionian'] = scaler['nat'][C]['i'] = scaler['nat'][C][1] = temp[1]
-    scaler['nat'][C]['dorian'] = scaler['nat'][C]['ii'] = scaler['nat'][C][2] = temp[3]
-    scaler['nat'][C]['phrygian'] = scaler['nat'][C]['iii'] = scaler['nat'][C][3] = temp[5]
-    scaler['nat'][C]['lydian'] = scaler['nat'][C]['iv'] = scaler['nat'][C][4] = temp[0]
-    scaler['nat'][C]['mixolydian'] = scaler['nat'][C]['v'] = scaler['nat'][C][5] = temp[2]
-    scaler['nat'][C]['aeolian'] = scaler['nat'][C]['vi'] = scaler['nat'][C][6] = temp[4]
-    scaler['nat'][C]['locrian'] = scaler['nat'][C]['vii'] = scaler['nat'][C][7] = temp[6]
-
-    scaler['harm'] = Bunch()
-    scaler['harm'][C] = Bunch()
-    scaler['harm'][C]['aeolian7'] = scaler['harm'][C]['i'] = scaler['harm'][C][1] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['aeolian'] ) ]
-    scaler['harm'][C]['locrian6'] = scaler['harm'][C]['ii'] = scaler['harm'][C][2] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['locrian'] ) ]
-    scaler['harm'][C]['ionian5'] = scaler['harm'][C]['iii'] = scaler['harm'][C][3] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['ionian'] ) ]
-    scaler['harm'][C]['dorian4'] = scaler['harm'][C]['iv'] = scaler['harm'][C][4] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['dorian'] ) ]
-    scaler['harm'][C]['phrygian3'] = scaler['harm'][C]['v'] = scaler['harm'][C][5] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['phrygian'] ) ]
-    scaler['harm'][C]['lydian2'] = scaler['harm'][C]['vi'] = scaler['harm'][C][6] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['lydian'] ) ]
-    scaler['harm'][C]['mixolydian1'] = scaler['harm'][C]['vii'] = scaler['harm'][C][7] = [ x+1 if key == 6 else x for key, x in enumerate( scaler['nat'][C]['mixolydian'] ) ]
-
-    # generate other scales
-    global i # workaround for i not being in context for list comprehensions
-    for i in range(1,12):
-        scaler['nat'][i] = Bunch()
-        scaler['nat'][i]['ionian'] = scaler['nat'][i]['i'] = scaler['nat'][i][1] = [ x+i for x in scaler['nat'][C][1] ]
-        scaler['nat'][i]['dorian'] = scaler['nat'][i]['ii'] = scaler['nat'][i][2] = [ x+i for x in scaler['nat'][C][2] ]
-        scaler['nat'][i]['phrygian'] = scaler['nat'][i]['iii'] = scaler['nat'][i][3] = [ x+i for x in scaler['nat'][C][3] ]
-        scaler['nat'][i]['lydian'] = scaler['nat'][i]['iv'] = scaler['nat'][i][4] = [ x+i for x in scaler['nat'][C][4] ]
-        scaler['nat'][i]['mixolydian'] = scaler['nat'][i]['v'] = scaler['nat'][i][5] = [ x+i for x in scaler['nat'][C][5] ]
-        scaler['nat'][i]['aeolian'] = scaler['nat'][i]['vi'] = scaler['nat'][i][6] = [ x+i for x in scaler['nat'][C][6] ]
-        scaler['nat'][i]['locrian'] = scaler['nat'][i]['vii'] = scaler['nat'][i][7] = [ x+i for x in scaler['nat'][C][7] ]
-
-        scaler['harm'][i] = Bunch()
-        scaler['harm'][i]['aeolian7'] = scaler['harm'][i]['i'] = scaler['harm'][i][1] = [ x+i for x in scaler['harm'][C][1] ]
-        scaler['harm'][i]['locrian6'] = scaler['harm'][i]['ii'] = scaler['harm'][i][2] = [ x+i for x in scaler['harm'][C][2] ]
-        scaler['harm'][i]['ionian5'] = scaler['harm'][i]['iii'] = scaler['harm'][i][3] = [ x+i for x in scaler['harm'][C][3] ]
-        scaler['harm'][i]['dorian4'] = scaler['harm'][i]['iv'] = scaler['harm'][i][4] = [ x+i for x in scaler['harm'][C][4] ]
-        scaler['harm'][i]['phrygian3'] = scaler['harm'][i]['v'] = scaler['harm'][i][5] = [ x+i for x in scaler['harm'][C][5] ]
-        scaler['harm'][i]['lydian2'] = scaler['harm'][i]['vi'] = scaler['harm'][i][6] = [ x+i for x in scaler['harm'][C][6] ]
-        scaler['harm'][i]['mixolydian1'] = scaler['harm'][i]['vii'] = scaler['harm'][i][7] = [ x+i for x in scaler['harm'][C][7] ]
-
-    mode_names = Bunch()
-    mode_names['nat'] = Bunch()
-    mode_names['nat'][1] = Bunch( name='ionian', numeral='i' )
-    mode_names['nat'][2] = Bunch( name='dorian', numeral='ii' )
-    mode_names['nat'][3] = Bunch( name='phrygian', numeral='iii' )
-    mode_names['nat'][4] = Bunch( name='lydian', numeral='iv' )
-    mode_names['nat'][5] = Bunch( name='mixolydian', numeral='v' )
-    mode_names['nat'][6] = Bunch( name='aeolian', numeral='vi'  )
-    mode_names['nat'][7] = Bunch( name='locrian', numeral='vii'  )
-
-    mode_names['harm'] = Bunch()
-    mode_names['harm'][1] = Bunch( name='aeolian7', numeral='i'  )
-    mode_names['harm'][2] = Bunch( name='locrian6', numeral='ii'  )
-    mode_names['harm'][3] = Bunch( name='ionian5', numeral='iii'  )
-    mode_names['harm'][4] = Bunch( name='dorian4', numeral='iv'  )
-    mode_names['harm'][5] = Bunch( name='phrygian3', numeral='v'  )
-    mode_names['harm'][6] = Bunch( name='lydian2', numeral='vi'  )
-    mode_names['harm'][7] = Bunch( name='mixolydian1', numeral='vii'  )
+    # scale families - add user defined scales with add_scale()
+    families = {}
+    families['nat'] = (0,2,4,5,7,9,11)      # natural major/minor modes
+    families['harm'] = (0,2,3,5,7,8,11)     # harmonic minor modes
+    families['mel'] = (0,2,3,5,7,9,11)      # melodic minor modes
+    families['penta'] = (0,2,4,7,9)         # major pentatonic - mode 5 is minor pentatonic
+    families['blues'] = (0,3,5,6,7,10)
+    families['whole'] = (0,2,4,6,8,10)
+    families['dim'] = (0,2,3,5,6,8,9,11)    # whole-half diminished
+    families['hira'] = (0,2,3,7,8)         # hirajoshi
+    families['chrom'] = (0,1,2,3,4,5,6,7,8,9,10,11)
+
+    mode_names = {}
+    mode_names['nat'] = ( 'ionian', 'dorian', 'phrygian', 'lydian', 'mixolydian', 'aeolian', 'locrian' )
+    mode_names['harm'] = ( 'aeolian7', 'locrian6', 'ionian5', 'dorian4', 'phrygian3', 'lydian2', 'mixolydian1' )
+    mode_names['mel'] = ( 'melodic', 'dorian2', 'lydian5', 'lydian7', 'mixolydian6', 'locrian2', 'altered' )
+    mode_names['penta'] = ( 'major_penta', 'suspended', 'blues_minor', 'blues_major', 'minor_penta' )
+    numerals = ( 'i', 'ii', 'iii', 'iv', 'v', 'vi', 'vii', 'viii', 'ix', 'x', 'xi', 'xii' )
+
+    # compiled tables - see compile()
+    table = []      # flat note table
+    scale_ids = {}  # (family, mode): scale id
+    base = []       # table offset of each scale id
+    length = []     # number of degrees in each scale id
+    cur_base = 0    # table offset of the current key - tonic row of the current scale
+    cur_len = 7     # number of degrees in the current scale
+
+    @classmethod
+    def compile(cls):
+        '''generate the note table for every mode of every family, in all 12 keys'''
+        table = []
+        scale_ids = {}
+        base = []
+        length = []
+        for family, intervals in cls.families.items():
+            size = len(intervals)
+            for mode in range(1, size+1):
+                root = intervals[mode-1]
+                steps = [ ( intervals[(mode-1+x) % size] - root ) % 12 for x in range(0, size) ]
+                scale_ids[ (family, mode,) ] = len(base)
+                base.append( len(table) )
+                length.append( size )
+                for tonic in range(0, 12):
+                    table.extend( tonic + step for step in steps )
+
+        cls.table = table
+        cls.scale_ids = scale_ids
+        cls.base = base
+        cls.length = length
+        cls.set_key( cls.tonic, cls.mode, cls.type )
+        return True
 
+    @classmethod
+    def add_scale(cls, family, intervals, names=() ):
+        '''add a user defined scale family and recompile the note table.
+        intervals are semitones above the tonic, starting with 0 - names optionally names the modes
+        '''
+        intervals = tuple( sorted( set( int(x) % 12 for x in intervals ) ) )
+        if ( not intervals or intervals[0] != 0 ):
+            raise Exception( "Scale Error: intervals of "+str(family)+" must include the tonic (0)" )
+        cls.families[family] = intervals
+        if ( names ):
+            cls.mode_names[family] = tuple( names )
+        return cls.compile()
+
+    @classmethod
+    def get_mode_num(cls, mode, scale='nat'):
+        '''returns the 1 based mode number of a mode number, name or numeral, or False'''
+        names = cls.mode_names.get( scale, () )
+        if ( mode in names ):
+            return names.index(mode) + 1
+        if ( mode in cls.numerals ):
+            mode = cls.numerals.index(mode) + 1
+        try:
+            mode = int(mode)
+        except ( TypeError, ValueError ):
+            return False
+        if ( scale in cls.families and mode >= 1 and mode <= len( cls.families[scale] ) ):
+            return mode
+        return False
 
     @classmethod
     def set_key(cls, tonic=0, mode=1, scale='nat' ):
-        if ( int(tonic) >= 0 and int(tonic) <=11 and int(mode) >= 1 and int(mode) <= 7 and ( scale == 'nat' or scale == 'harm' ) ):
-            cls.tonic = tonic # key root note
-            cls.mode = 1 # 1 based - will also accept mode names
-            cls.type = 'nat' # 'nat' or 'harm' for natural or harmonic minor scales as a basis for the mode calculations.
+        if ( not cls.table ):
+            cls.compile()
+        mode = cls.get_mode_num( mode, scale )
+        if ( int(tonic) >= 0 and int(tonic) <=11 and mode and ( scale, mode, ) in cls.scale_ids ):
+            scale_id = cls.scale_ids[ (scale, mode,) ]
+            cls.tonic = int(tonic) # key root note
+            cls.mode = mode # 1 based
+            cls.type = scale # scale family
+            cls.cur_len = cls.length[scale_id]
+            cls.cur_base = cls.base[scale_id] + cls.tonic * cls.cur_len
             return True
         else:
             return False
@@ -485,20 +601,184 @@ class Scales:
         '''returns a tuple containing info on the current key/scale/mode
         ( int_tonic, int_mode, str_scale, )
         '''
-        return ( cls.tonic, cls.mode, cls.scale, )
+        return ( cls.tonic, cls.mode, cls.type, )
 
     @classmethod
     def get_note_by_degree(cls, degree, octave):
-        '''retrieve note number by scale degree (1-7) and octave
-        degree may be higher than 7 under some circumstances
+        '''retrieve note number by scale degree (1 based) and octave
+        degrees past either end of the scale wrap into the next/previous octave
         '''
-        # deal with degrees higher than 7 - loop them around, forcing a number between 1 and 7.
-        deg = degree % 8
-        # but account for the octave offset
-        octave += ( degree // 8 )
+        if ( not cls.table ):
+            cls.compile()
+        degree -= 1
+        return cls.table[ cls.cur_base + degree % cls.cur_len ] + 12 * ( octave + degree // cls.cur_len )
+
+class ChannelAllocator:
+    '''hands out MPE member channels, one per sounding note.
+
+    Channels live in one of two doubly linked lists kept in fixed 16 slot arrays:
+    the free list, ordered by release time (least recently released at the head), and
+    the busy list, ordered by allocation time (oldest note at the head).
+    allocate() takes the head of the free list, or steals the oldest busy channel when
+    every member channel is sounding.  allocate() and release() are constant time.
+    Not thread safe - Padstrument calls it under the port's lock.
+    '''
+    FREE = 0
+    BUSY = 1
+
+    def __init__(self, channels=range(1,16)):
+        self.channels = tuple( channels )
+        self.prev = [-1] * 16   # linked list pointers, indexed by channel
+        self.next = [-1] * 16
+        self.owner = [-1] * 16  # id of the pad playing on each channel
+        self.note = [-1] * 16   # note sounding on each channel
+        self.head = [-1, -1]    # [free, busy]
+        self.tail = [-1, -1]
+        for channel in self.channels:
+            self.append( self.FREE, channel )
+
+    def append(self, lst, channel):
+        '''add channel to the tail of list lst'''
+        tail = self.tail[lst]
+        self.prev[channel] = tail
+        self.next[channel] = -1
+        if ( tail < 0 ):
+            self.head[lst] = channel
+        else:
+            self.next[tail] = channel
+        self.tail[lst] = channel
+
+    def unlink(self, lst, channel):
+        '''remove channel from list lst'''
+        prev = self.prev[channel]
+        nxt = self.next[channel]
+        if ( prev < 0 ):
+            self.head[lst] = nxt
+        else:
+            self.next[prev] = nxt
+        if ( nxt < 0 ):
+            self.tail[lst] = prev
+        else:
+            self.prev[nxt] = prev
+
+    def allocate(self, owner, note):
+        '''returns a tuple (channel, stolen_note) - stolen_note is -1 unless the channel
+        was stolen from a sounding note, which the caller has to turn off
+        '''
+        channel = self.head[self.FREE]
+        stolen = -1
+        if ( channel < 0 ):
+            channel = self.head[self.BUSY]
+            stolen = self.note[channel]
+            self.unlink( self.BUSY, channel )
+        else:
+            self.unlink( self.FREE, channel )
+        self.append( self.BUSY, channel )
+        self.owner[channel] = owner
+        self.note[channel] = note
+        return ( channel, stolen, )
+
+    def release(self, channel, owner):
+        '''return channel to the free list.  returns False if owner no longer holds
+        the channel (it was stolen, and its note already turned off)'''
+        if ( self.owner[channel] != owner ):
+            return False
+        self.unlink( self.BUSY, channel )
+        self.append( self.FREE, channel )
+        self.owner[channel] = -1
+        self.note[channel] = -1
+        return True
+
+    def config_msgs(self, manager=0):
+        '''returns the MPE configuration messages (RPN 6 on the manager channel)
+        announcing a lower zone with this allocator's member channels'''
+        cc = [ (101, 0), (100, 6), (6, len(self.channels)), (101, 127), (100, 127) ]
+        return [ mido.Message( 'control_change', channel=manager, control=control, value=value ) for control, value in cc ]
+
+
+class NoteBits:
+    '''a 128 bit note set per midi channel, kept as ints.
+    set/clear/test are constant time, and pop_all() only visits the notes that are set.
+    '''
+    def __init__(self):
+        self.bits = [0] * 16
+
+    def set(self, channel, note):
+        self.bits[channel] |= 1 << note
+
+    def clear(self, channel, note):
+        self.bits[channel] &= ~( 1 << note )
+
+    def test(self, channel, note):
+        return ( self.bits[channel] >> note ) & 1
+
+    def pop_all(self):
+        '''empty the set, returning a list of (channel, note) tuples for the notes that were in it'''
+        notes = []
+        bits = self.bits
+        for channel in range(0, 16):
+            b = bits[channel]
+            if ( b ):
+                bits[channel] = 0
+                while ( b ):
+                    low = b & -b # lowest set bit
+                    notes.append( ( channel, low.bit_length() - 1, ) )
+                    b ^= low
+        return notes
+
+
+class Metrics:
+    '''message counts, callback latency and send batch sizes.
+    Recorded by both midi callback threads and read by the Remote thread, so every update is made
+    under a small lock - the counters would lose updates otherwise.  Latency is kept in a fixed
+    ring of the last `size` callbacks, and only sorted when someone asks for percentiles.
+    '''
+    size = 1024
+
+    def __init__(self):
+        self.started = time.time()
+        self.counts = {}            # messages handled, per message type
+        self.latency = [0.0] * self.size
+        self.pos = 0                # callbacks recorded
+        self.max_batch = 0          # most messages sent by one callback
+        self.lock = Lock()
+
+    def record(self, msgtype, seconds):
+        '''record one callback'''
+        with self.lock:
+            counts = self.counts
+            counts[msgtype] = counts.get( msgtype, 0 ) + 1
+            self.latency[ self.pos % self.size ] = seconds
+            self.pos += 1
+
+    def batch(self, size):
+        if ( size > self.max_batch ):
+            with self.lock:
+                if ( size > self.max_batch ):
+                    self.max_batch = size
+
+    def percentiles(self, points=(50, 90, 99, 100)):
+        '''callback latency percentiles in ms, over the ring'''
+        with self.lock:
+            n = min( self.pos, self.size )
+            samples = self.latency[:n]
+        if ( not n ):
+            return {}
+        samples.sort()
+        return { 'p'+str(point): round( samples[ min( n-1, (n*point)//100 ) ] * 1000, 4 ) for point in points }
+
+    def dump(self):
+        with self.lock:
+            messages = self.pos
+            counts = dict( self.counts )
+        return {
+            'uptime': round( time.time() - self.started, 1 ),
+            'messages': messages,
+            'counts': counts,
+            'latency_ms': self.percentiles(),
+            'max_batch': self.max_batch,
+            }
 
-        notenum = cls.scaler[cls.type][cls.tonic][cls.mode][deg-1] + ( 12 * octave )
-        return notenum
 
 class Pad(Bunch):
     '''Pad object contains info about each nanopad button
@@ -511,11 +791,13 @@ class Pad(Bunch):
     row = False         # row location in 2x8 nanopad grid
     col = False         # column location
     pad_note = False    # note emitted by nanopad button
+    bit = 0             # the pad's bit in its nanopad's pressed bits
 
     # out note information
     out_note = False    # note to be sent out when button is pressed
     out_degree = False  # scale degree of out_note
     out_octave = False
+    routes = ()         # (port, channel, note, allocator) tuples compiled from the pad's zones
 
     # pad state information
     pressed = False
@@ -554,10 +836,18 @@ class Padstrument:
     syx_search = [ 0x42, 0x50, 0x00, 0x00 ] # send this to get response containing channel number
     syx_native_mode_on = [ 0x00,  0x00, 0x01 ]
 
-    midi_out_channel=1
+    midi_backend = 'mido.backends.rtmidi/LINUX_ALSA' # padsim runs without hardware
+    sysex_timeout = 2 # seconds to wait for a nanopad sysex reply
     def_button_mode = 'play'
 #    def_note_layout = 'hang_full'
     def_note_layout = 'lead'
+    def_zone_map = 'single'
+    profile_seconds = 10 # length of an on demand profiling window
+    profile_dir = '.' # where profiles are written
+    # native mode X-Y pad - control changes on channel 15 (nanoPAD2 midi implementation 4(3))
+    xy_x_cc = 9 # X axis - pitch bend
+    xy_y_cc = 10 # Y axis - channel pressure
+    xy_touch_cc = 11 # pad touch - 127 on, 0 off
 
     scene = Bunch()
     scene[0] = Bunch()
@@ -567,16 +857,30 @@ class Padstrument:
     scene[0].modes = ['ts0', 'ts1', 'ts2', 'ts3', 'ts4' ]
     scene[1].modes = ['bs0', 'bs1', 'bs2', 'bs3', 'bs4' ]
 
-    def __init__(self):
-        mido.set_backend('mido.backends.rtmidi/LINUX_ALSA')
+    def __init__(self, backend=None):
+        mido.set_backend( backend if backend else self.midi_backend )
         self.cur_mode = self.def_button_mode
         self.cur_note_layout = self.def_note_layout
+        self.cur_zone_map = self.def_zone_map
+        self.outports = {} # output port pool - port name: open port
+        self.mpe = {} # MPE channel allocators - port name: ChannelAllocator
+        self.held = {} # notes sounding, per port: NoteBits
+        self.latched = {} # notes latched on, per port: NoteBits
+        self.sustained = {} # notes released while sustain is on, per port: NoteBits
+        self.port_locks = {} # per port: Lock - guards the port's NoteBits and MPE allocator, shared by both callback threads
+        self.sustain_on = False
+        self.latch_on = False
+        self.config_lock = Lock() # serializes reconfigure()
+        self.metrics = Metrics()
+        self.remote = False
+        self.view = False
+        self.profiler = Profiler( self, self.profile_dir )
+        self.local = local() # per callback thread storage - outgoing message batches
         self.connect()  # connect nanopads
+        self.open_outports()
         self.make_padmaps()
         self.set_top_NP2(0)
 
-        self.outport = mido.open_output("padstrument_out", virtual=True)
-
     def reset(self, top_pad_id=None):
         '''reset storage variables to defaults'''
         self.cur_mode = self.def_button_mode
@@ -613,8 +917,12 @@ class Padstrument:
         callback=[ self.handler_0, self.handler_1 ]
         # open port
         self.NP2[NP2num] = mido.open_ioport( id_str, autoreset=True, callback = callback[NP2num] )
+        self.NP2[NP2num].sysex_event = Event()
         self.NP2[NP2num].num = NP2num
         self.NP2[NP2num].id_str = id_str
+        self.NP2[NP2num].playing = [ () ] * 128 # routes sent per nanopad note - released with the same routes
+        self.NP2[NP2num].expression = () # routes of the last pressed pad - X-Y pad expression goes here
+        self.NP2[NP2num].pressed = 0 # Pad.bit of every pad held down - for GridView
 
         # send device search sysex - get device channel
         syxin = self.catch_sysex_reply( NP2num, mido.Message( 'sysex', data=self.syx_search ) )
@@ -631,6 +939,43 @@ class Padstrument:
 
         return True
 
+    def open_outports( self ):
+        '''open every output port used by the current zone map,
+        and set up MPE on the ports of MPE zones'''
+        for name in Zones.get_ports( self.cur_zone_map ):
+            self.get_outport( name )
+        for row in range (0,4):
+            for col in range (0,8):
+                for zone in Zones.get_zones( row, col, self.cur_zone_map ):
+                    if ( zone.mpe ):
+                        self.get_allocator( zone )
+        self.flush_out()
+        return True
+
+    def get_outport( self, name ):
+        '''returns the pooled output port called name - ports are only opened once'''
+        if ( name not in self.outports ):
+            logging.debug("open output port %s", name)
+            port = mido.open_output( name, virtual=True )
+            self.held[port] = NoteBits()
+            self.latched[port] = NoteBits()
+            self.sustained[port] = NoteBits()
+            self.port_locks[port] = Lock()
+            self.outports[name] = port
+        return self.outports[name]
+
+    def get_allocator( self, zone ):
+        '''returns the MPE channel allocator of an MPE zone's port.  The first time a port
+        is used for MPE, its configuration messages are queued.'''
+        if ( zone.port not in self.mpe ):
+            logging.debug("MPE on %s - %i member channels", zone.port, zone.mpe)
+            alloc = ChannelAllocator( range( 1, zone.mpe+1 ) )
+            port = self.get_outport( zone.port )
+            for msg in alloc.config_msgs():
+                self.queue_out( port, msg )
+            self.mpe[zone.port] = alloc
+        return self.mpe[zone.port]
+
     def port_close( self ):
         '''close all midi ports'''
         for NP2num, port in self.NP2.items():
@@ -645,6 +990,7 @@ class Padstrument:
         Nothing should be necessary to switch top/bottom other than this function
         no reset should be required.'''
         logging.debug("SET TOP %i", topnum)
+        self.topnum = topnum
         bottomnum = 1 if topnum == 0 else 0
         # assign padmaps - these map notes to grid coordinates, with other
         self.NP2[topnum].padmap = self.padmap['top']
@@ -660,12 +1006,13 @@ class Padstrument:
     def catch_sysex_reply( self, NP2num, msg ):
         '''sets a flag telling the callback to catch the next incoming sysex message
         for catching sysex replies.  Workaround for fucked up receive() locking'''
-        self.NP2[NP2num].catch_next_sysex = True
         self.NP2[NP2num].caught_sysex = False
+        self.NP2[NP2num].sysex_event.clear()
+        self.NP2[NP2num].catch_next_sysex = True
 
         self.NP2[NP2num].send( msg )
-        while ( not self.NP2[NP2num].caught_sysex ):
-            time.sleep(0.01)
+        if ( not self.NP2[NP2num].sysex_event.wait( self.sysex_timeout ) ):
+            raise Exception( "No sysex reply from "+str(self.NP2[NP2num].id_str) )
         syxin = self.NP2[NP2num].caught_sysex
         self.NP2[NP2num].caught_sysex = False
         return syxin
@@ -683,63 +1030,59 @@ class Padstrument:
         for row in range (0,2):
             for col in range (0,8):
                 topnote = Translate.top_grid2note( row, col )
-                outnote = Layouts.get_note( row, col, self.cur_note_layout ) # tuple
-                events = Layouts.get_button( row, col )
-
-                self.padmap["top"][ topnote ] = Pad(
-                    grid_row = row,    # row location in full 4x8 grid
-                    row = row,         # row location in 2x8 nanopad grid
-                    col = col,         # column location
-                    pad_note = topnote,    # note emitted by nanopad button
-
-                    # out note information
-                    out_note = Scales.get_note_by_degree( outnote[0], outnote[1] ),    # note to be sent out when button is pressed
-                    out_degree = outnote[0],  # scale degree of out_note
-                    out_octave = outnote[1],
-
-                    # pad state information
-                    pressed = False,
-
-                    # pad action information
-                    # onpress/release is false or a string to be parsed by a handler function
-                    # args can be a dict or a string or false
-                    onpress = events[0],
-                    onpress_args = events[1],
-                    onrelease = events[2],
-                    onrelease_args = events[3],
-                    )
+                self.padmap["top"][ topnote ] = self.make_pad( row, row, col, topnote )
 
                 bottomnote = Translate.bottom_grid2note( row, col )
-                outnote = Layouts.get_note( row+2, col, self.cur_note_layout ) # tuple
-                events = Layouts.get_button( row+2, col )
-
-                self.padmap["bottom"][ bottomnote ] = Pad(
-                    grid_row = row+2,    # row location in full 4x8 grid
-                    row = row,         # row location in 2x8 nanopad grid
-                    col = col,         # column location
-                    pad_note = topnote,    # note emitted by nanopad button
-
-                    # out note information
-                    out_note = Scales.get_note_by_degree( outnote[0], outnote[1] ),    # note to be sent out when button is pressed
-                    out_degree = outnote[0],  # scale degree of out_note
-                    out_octave = outnote[1],
-
-                    # pad state information
-                    pressed = False,
-
-                    # pad action information
-                    # onpress/release is false or a string to be parsed by a handler function
-                    # args can be a dict or a string or false
-                    onpress = events[0],
-                    onpress_args = events[1],
-                    onrelease = events[2],
-                    onrelease_args = events[3],
-                    )
+                self.padmap["bottom"][ bottomnote ] = self.make_pad( row+2, row, col, bottomnote )
         return True
 
+    def make_pad(self, grid_row, row, col, pad_note):
+        '''create the Pad object for one button, with its zone routing compiled in'''
+        outnote = Layouts.get_note( grid_row, col, self.cur_note_layout ) # tuple
+        events = Layouts.get_button( grid_row, col )
+        out_note = Scales.get_note_by_degree( outnote[0], outnote[1] )
+
+        # compile zone routing - one (port, channel, note, allocator) per zone, notes out of midi range are dropped
+        routes = []
+        for zone in Zones.get_zones( grid_row, col, self.cur_zone_map ):
+            note = out_note + zone.transpose
+            alloc = self.get_allocator( zone ) if zone.mpe else None
+            if ( note >= 0 and note <= 127 ):
+                routes.append( ( self.get_outport( zone.port ), zone.channel, note, alloc, ) )
+            else:
+                logging.debug("pad %i,%i out of range in zone on port %s - dropped", grid_row, col, zone.port)
+
+        return Pad(
+            grid_row = grid_row,    # row location in full 4x8 grid
+            row = row,         # row location in 2x8 nanopad grid
+            col = col,         # column location
+            pad_note = pad_note,    # note emitted by nanopad button
+            bit = 1 << ( pad_note - 64 ),
+
+            # out note information
+            out_note = out_note,    # note to be sent out when button is pressed
+            out_degree = outnote[0],  # scale degree of out_note
+            out_octave = outnote[1],
+            routes = tuple( routes ),
+
+            # pad state information
+            pressed = False,
+
+            # pad action information
+            # onpress/release is false or a string to be parsed by a handler function
+            # args can be a dict or a string or false
+            onpress = events[0],
+            onpress_args = events[1],
+            onrelease = events[2],
+            onrelease_args = events[3],
+            )
+
     def scene_pressed(self, NP2num ):
         '''a scene/settings button was pressed'''
         self.scene[NP2num].pressed = True
+        # both SCENE buttons together toggle profiling
+        if ( self.scene[0].pressed and self.scene[1].pressed ):
+            self.toggle_profile()
         if ( self.cur_mode == self.def_button_mode ):
             self.cur_mode = self.scene[NP2num].modes[0]
             self.set_all_scene_leds( NP2num, 0b1111 )
@@ -773,14 +1116,135 @@ class Padstrument:
 
     def handler_0( self, msg, NP2num=0 ):
         '''wrapper for handle_msgs() that plugs in the pad number.'''
+        start = time.perf_counter()
         self.handle_msgs(msg, NP2num)
+        self.flush_out()
+        self.metrics.record( msg.type, time.perf_counter() - start )
 
     def handler_1( self, msg, NP2num=1 ):
         '''wrapper for handle_msgs() that plugs in the pad number.'''
+        start = time.perf_counter()
         self.handle_msgs(msg, NP2num)
+        self.flush_out()
+        self.metrics.record( msg.type, time.perf_counter() - start )
+
+    def queue_out( self, port, msg ):
+        '''queue an outgoing message on this callback thread's batch.
+        Nothing is sent until flush_out() is called at the end of the callback.'''
+        try:
+            batch = self.local.batch
+        except AttributeError:
+            batch = self.local.batch = {}
+        if ( port in batch ):
+            batch[port].append( msg )
+        else:
+            batch[port] = [ msg ]
+
+    def note_start( self, NP2num, msg, pad ):
+        '''send a note on to every zone the pad is routed to, copying the trigger
+        message's velocity and type.  MPE routes get a member channel of their own.'''
+        owner = NP2num*128 + msg.note
+        sent = []
+        for port, channel, note, alloc in pad.routes:
+            stolen = -1
+            with self.port_locks[port]:
+                if ( alloc ):
+                    channel, stolen = alloc.allocate( owner, note )
+                    if ( stolen >= 0 ):
+                        self.held[port].clear( channel, stolen )
+                        self.latched[port].clear( channel, stolen )
+                        self.sustained[port].clear( channel, stolen )
+                self.held[port].set( channel, note )
+                self.sustained[port].clear( channel, note ) # struck again - held, not sustained
+            if ( stolen >= 0 ):
+                self.queue_out( port, mido.Message( 'note_off', channel=channel, note=stolen, velocity=64 ) )
+            self.queue_out( port, msg.copy( note=note, channel=channel ) )
+            sent.append( ( port, channel, note, alloc, ) )
+        sent = tuple( sent )
+        self.NP2[NP2num].playing[msg.note] = sent
+        self.NP2[NP2num].expression = sent
+        return sent
+
+    def note_stop( self, NP2num, msg ):
+        '''send note offs for whatever the nanopad note started, freeing MPE channels.
+        With sustain on, the notes are left sounding until sustain is released.'''
+        owner = NP2num*128 + msg.note
+        playing = self.NP2[NP2num].playing
+        for port, channel, note, alloc in playing[msg.note]:
+            with self.port_locks[port]:
+                if ( alloc and alloc.owner[channel] != owner ):
+                    continue # channel was stolen - its note off has been sent already
+                self.latched[port].clear( channel, note )
+                if ( self.sustain_on ):
+                    self.sustained[port].set( channel, note )
+                    continue
+                if ( alloc ):
+                    alloc.release( channel, owner )
+                self.held[port].clear( channel, note )
+            self.queue_out( port, msg.copy( note=note, channel=channel ) )
+        playing[msg.note] = ()
+
+    def is_latched( self, NP2num, note ):
+        '''True if the notes the nanopad note started are latched on'''
+        playing = self.NP2[NP2num].playing[note]
+        return bool( playing ) and bool( self.latched[ playing[0][0] ].test( playing[0][1], playing[0][2] ) )
+
+    def note_latch( self, NP2num, msg, pad ):
+        '''latched pads start their notes on the first tap and stop them on the next'''
+        if ( self.is_latched( NP2num, msg.note ) ):
+            self.note_stop( NP2num, mido.Message( 'note_off', channel=msg.channel, note=msg.note, velocity=64 ) )
+        else:
+            for port, channel, note, alloc in self.note_start( NP2num, msg, pad ):
+                with self.port_locks[port]:
+                    self.latched[port].set( channel, note )
+
+    def release_all( self, notebits ):
+        '''send note offs for every note in notebits ( per port NoteBits - self.held, self.latched or
+        self.sustained ), and empty it'''
+        for port, bits in notebits.items():
+            alloc = self.mpe.get( port.name )
+            with self.port_locks[port]:
+                notes = bits.pop_all()
+                for channel, note in notes:
+                    if ( alloc ):
+                        alloc.release( channel, alloc.owner[channel] )
+                    self.held[port].clear( channel, note )
+                    self.latched[port].clear( channel, note )
+                    self.sustained[port].clear( channel, note )
+            for channel, note in notes:
+                self.queue_out( port, mido.Message( 'note_off', channel=channel, note=note, velocity=64 ) )
+
+    def note_expression( self, NP2num, msg ):
+        '''turn native X-Y pad CCs into expression on the notes of the last pressed pad - X is
+        pitch bend, Y is channel pressure, and letting go of the X-Y pad re-centres both.
+        In MPE zones each note has a channel of its own, so the expression is per note.'''
+        if ( msg.control == self.xy_x_cc ):
+            out = ( ( 'pitchwheel', 'pitch', ( msg.value - 64 ) * 128 ), )
+        elif ( msg.control == self.xy_y_cc ):
+            out = ( ( 'aftertouch', 'value', msg.value ), )
+        elif ( msg.value ):
+            return # touched - X and Y follow
+        else:
+            out = ( ( 'pitchwheel', 'pitch', 0 ), ( 'aftertouch', 'value', 0 ) )
+        for port, channel, note, alloc in self.NP2[NP2num].expression:
+            for kind, field, value in out:
+                self.queue_out( port, mido.Message( kind, channel=channel, **{ field: value } ) )
+
+    def flush_out( self ):
+        '''send this callback thread's batch, grouped per port, so fanning a pad out
+        to several zones sends back to back instead of interleaving with the routing work'''
+        batch = getattr( self.local, 'batch', None )
+        if ( batch ):
+            self.local.batch = {}
+            size = 0
+            for port, msgs in batch.items():
+                for msg in msgs:
+                    port.send( msg )
+                size += len( msgs )
+            self.metrics.batch( size )
 
     def handle_msgs(self, msg, NP2num):
-        logging.debug("MSG %s - pad %i - hex %s ", msg, NP2num, msg.hex())
+        logging.debug("MSG %s - pad %i", msg, NP2num)
 
         if ( msg.type == "sysex" ):
             logging.debug("hex %s", msg.hex())
@@ -788,6 +1252,7 @@ class Padstrument:
             if ( self.NP2[NP2num].catch_next_sysex == True ):
                 self.NP2[NP2num].catch_next_sysex = False
                 self.NP2[NP2num].caught_sysex = msg
+                self.NP2[NP2num].sysex_event.set()
             return True
 
         # handle noteon and noteoffs in default mode
@@ -799,26 +1264,26 @@ class Padstrument:
 
             if ( msg.type == "note_on" ):
                 pad.pressed = True
+                self.NP2[NP2num].pressed |= pad.bit
                 action = pad.onpress
                 action_args = pad.onpress_args
-                if (not action) or ( action != "outnote"):
-                    return False
+                if ( action == "outnote" ):
+                    self.note_start( NP2num, msg, pad )
+                elif ( action == "latchnote" ):
+                    self.note_latch( NP2num, msg, pad )
                 else:
-                    # send note message, copying the trigger message's velocity and type
-                    outmsg = msg.copy( note=pad.out_note, channel=self.midi_out_channel )
-                    logging.debug("out"+str(outmsg))
-                    self.outport.send(outmsg)
+                    return False
             elif ( msg.type == "note_off" ):
                 pad.pressed = False
+                self.NP2[NP2num].pressed &= ~pad.bit
                 action = pad.onrelease
                 action_args = pad.onrelease_args
-                if (not action) or ( action != "outnote"):
-                    return False
+                # a pad pressed before the button layout changed still needs its note off
+                if ( action == "outnote" or
+                ( self.NP2[NP2num].playing[msg.note] and not self.is_latched( NP2num, msg.note ) ) ):
+                    self.note_stop( NP2num, msg )
                 else:
-                    # send note message, copying the trigger message's velocity and type
-                    outmsg = msg.copy( note=pad.out_note, channel=self.midi_out_channel )
-                    logging.debug("out"+str(outmsg))
-                    self.outport.send(outmsg)
+                    return False
             return True
 
         # get SCENE button presses - activate/deactivate SETTINGS modes
@@ -833,47 +1298,702 @@ class Padstrument:
                 #self.reset(self.NP2[NP2num].id_str)
             return True
 
+        # X-Y pad in play mode - pitch bend and pressure
+        if ( self.cur_mode == self.def_button_mode and msg.type == "control_change" and msg.channel == 15 and
+        ( msg.control == self.xy_x_cc or msg.control == self.xy_y_cc or msg.control == self.xy_touch_cc ) ):
+            self.note_expression( NP2num, msg )
+            return True
+
+        if ( msg.type != "note_on" and msg.type != "note_off" ):
+            return False
+
+        # only trigger pad notes are buttons - Touch Scale notes (channel 2, any note number) aren't
+        if ( msg.channel != 1 or msg.note not in self.NP2[NP2num].padmap ):
+            return False
+
         otherNP2num = 0 if NP2num == 1 else 1
         if ( msg.type == "note_on" ):
             # deal with settings button presses
             pad = self.NP2[NP2num].padmap[msg.note]
             pad.pressed=True
+            self.NP2[NP2num].pressed |= pad.bit
             # if SCENE + all four s1-s4 buttons are pressed, then set this pad as top
             if ( self.scene[NP2num]['pressed'] and
                 self.NP2[NP2num].padmap[71].pressed and
                 self.NP2[NP2num].padmap[79].pressed
                 ): # set this pad to top
                     self.set_top_NP2(NP2num)
+            else:
+                button = Layouts.get_button( pad.grid_row, pad.col, self.cur_mode )
+                self.do_action( button[0], button[1], True )
 
         elif ( msg.type == "note_off" ):
             # deal with settings button releases
             pad = self.NP2[NP2num].padmap[msg.note]
             pad.pressed=False
+            self.NP2[NP2num].pressed &= ~pad.bit
+            # a pad played before the scene button went down is still sounding
+            if ( self.NP2[NP2num].playing[msg.note] and not self.is_latched( NP2num, msg.note ) ):
+                self.note_stop( NP2num, msg )
 
 
         pad = self.NP2[NP2num].padmap[msg.note]
         logging.debug( "curmode: %s | button action: %s", self.cur_mode, Layouts.get_button(pad.grid_row, pad.col, self.cur_mode)[0] )
 
-    def s1(self, press=True):
+    def do_action(self, action, args=False, press=True):
+        '''run a settings button action - actions are methods with the keyword's name'''
+        if ( not action ):
+            return False
+        handler = getattr( self, action, None )
+        if ( handler is None ):
+            logging.debug("no handler for button action %s", action)
+            return False
+        return handler( press, args )
+
+    def s1(self, press=True, args=False):
         pass
 
-    def s2(self, press=True):
+    def s2(self, press=True, args=False):
         pass
 
-    def s3(self, press=True):
+    def s3(self, press=True, args=False):
         pass
 
-    def s4(self, press=True):
+    def s4(self, press=True, args=False):
         pass
 
+    def sustain(self, press=True, args=False):
+        '''toggle global sustain - turning it off releases every sustained note'''
+        self.sustain_on = not self.sustain_on
+        logging.debug("sustain %s", self.sustain_on)
+        if ( not self.sustain_on ):
+            self.release_all( self.sustained )
+        return True
+
+    def latch(self, press=True, args=False):
+        '''toggle latch - every pad becomes tap on, tap off.  Turning it off releases latched notes'''
+        self.latch_on = not self.latch_on
+        logging.debug("latch %s", self.latch_on)
+        self.reconfigure( button_layout='latch' if self.latch_on else 'play' )
+        if ( not self.latch_on ):
+            self.release_all( self.latched )
+        return True
+
+    def panic(self, press=True, args=False):
+        '''all notes off - sends a note off for every note sounding (held, latched or sustained),
+        frees every MPE channel and forgets what the pads started'''
+        logging.debug("panic")
+        for NP2num in ( 0, 1 ):
+            self.NP2[NP2num].playing = [ () ] * 128
+            self.NP2[NP2num].expression = ()
+        self.release_all( self.held ) # latched and sustained notes are held until their note off is sent
+        self.flush_out()
+        return True
+
+    def set_tonic(self, press=True, args=0):
+        return self.reconfigure( tonic=args )
+
+    def set_mode(self, press=True, args=1):
+        return self.reconfigure( mode=args )
+
+    def set_scale(self, press=True, args='nat'):
+        '''change scale family, keeping the mode if the new family has it'''
+        return self.reconfigure( scale=args ) or self.reconfigure( scale=args, mode=1 )
+
+    def set_C_major(self, press=True, args=False):
+        return self.reconfigure( tonic=C, mode=1, scale='nat' )
+
+    def reconfigure(self, tonic=None, mode=None, scale=None, note_layout=None,
+            button_layout=None, zone_map=None, top=None ):
+        '''change settings and swap in padmaps built for them.
+        Every settings change - settings buttons, latch, the remote - goes through here.
+        The new padmaps are built off to the side and swapped in by set_top_NP2(), so a callback
+        sees either the old maps or the new ones, never a half built map.  Notes already sounding
+        are released through the routes they were started with.
+        returns False, changing nothing, if the key is invalid.
+        '''
+        with self.config_lock:
+            if ( tonic is not None or mode is not None or scale is not None ):
+                key = Scales.get_key()
+                if ( not Scales.set_key( key[0] if tonic is None else tonic,
+                        key[1] if mode is None else mode,
+                        key[2] if scale is None else scale ) ):
+                    return False
+            if ( note_layout is not None ):
+                Layouts.set_note_layout( note_layout )
+                self.cur_note_layout = note_layout
+            if ( button_layout is not None ):
+                Layouts.set_button_layout( button_layout )
+            if ( zone_map is not None ):
+                Zones.set_zone_map( zone_map )
+                self.cur_zone_map = zone_map
+                self.open_outports()
+            self.make_padmaps()
+            self.set_top_NP2( self.topnum if top is None else top )
+        return True
+
+    def get_state(self):
+        '''current settings, for the remote'''
+        return {
+            'key': Scales.get_key(),
+            'note_layout': self.cur_note_layout,
+            'button_layout': Layouts.current_button_mode,
+            'zone_map': self.cur_zone_map,
+            'top': self.topnum,
+            'mode': self.cur_mode,
+            'sustain': self.sustain_on,
+            'latch': self.latch_on,
+            }
+
+    def get_metrics(self):
+        '''metrics dump.  queues has the input queue depth of each nanopad port that can report
+        one - rtmidi doesn't expose its queue, so only simulated pads (padsim) show up there; on
+        hardware the callback latency percentiles are the measure of falling behind.
+        remote_max_burst is the most remote requests handled in one wakeup, a high water mark.'''
+        metrics = self.metrics.dump()
+        metrics['queues'] = { str( self.NP2[num].id_str ): self.NP2[num].depth() for num in (0, 1) if hasattr( self.NP2[num], 'depth' ) }
+        if ( self.remote ):
+            metrics['remote_max_burst'] = self.remote.max_burst
+        return metrics
+
+    def toggle_profile(self, seconds=None):
+        '''start a profiling window, or stop the running one - see Profiler'''
+        if ( self.profiler.running ):
+            return self.profiler.stop()
+        return self.profiler.start( seconds if seconds else self.profile_seconds )
+
+    def start_remote(self, port=9123, host='127.0.0.1'):
+        '''start the OSC control/metrics server - see Remote.  If it can't listen (the port is
+        taken), the instrument plays on without it and this returns False.'''
+        remote = Remote( self, host, port )
+        try:
+            remote.start()
+        except OSError as e:
+            logging.warning("remote control off - can't listen on %s:%i - %s", host, port, e)
+            return False
+        self.remote = remote
+        return self.remote
+
+    def start_view(self, fps=15):
+        '''start the live terminal grid view - see GridView'''
+        self.view = GridView( self, fps )
+        self.view.start()
+        return self.view
+
+
+class Profiler:
+    '''on demand profiling of the midi callbacks, for a bounded window.
+
+    start() puts timing wrappers over handle_msgs, make_padmaps, catch_sysex_reply and flush_out
+    (the send path) as instance attributes, which are deleted again when the window ends - with
+    profiling off the class methods run untouched, so it costs nothing.  The handle_msgs and
+    flush_out wrappers also profile the call on the thread making it: a sys.setprofile hook is
+    installed for the length of the call, and times every python and builtin call under it into a
+    table of that thread's own.  This works the same on every python (from 3.12 only one cProfile
+    can be enabled at a time), and sees the callbacks while they work - a sampling thread only gets
+    the GIL while they wait for input, so it hardly ever does.  The hook slows the profiled calls
+    down several times over: the wrapper timings of a window are inflated, the breakdown is what
+    to read.
+
+    The window ends after its seconds, or early on stop().  Either way the profiler's own thread
+    deletes the wrappers, merges the per thread tables and writes per function timings and the
+    functions with the most own time to padstrument-<time>.txt, and the call stacks, weighted by
+    own time in microseconds, to padstrument-<time>.folded - the collapsed format flame graph
+    tools read.  Nothing slow is done on a callback thread.
+    '''
+    functions = ( 'handle_msgs', 'make_padmaps', 'catch_sysex_reply', 'flush_out' )
+    profiled = ( 'handle_msgs', 'flush_out' ) # entry points of the callback threads
+
+    def __init__(self, pad, directory='.'):
+        self.pad = pad
+        self.directory = directory
+        self.running = False
+        self.lock = Lock()
+
+    def start(self, seconds=10):
+        '''profile for seconds (a number more than 0), then write the results.
+        returns False if a window is already running'''
+        seconds = float( seconds )
+        if ( not 0 < seconds < float('inf') ):
+            raise ValueError( "seconds must be more than 0" )
+        with self.lock:
+            if ( self.running ):
+                return False
+            self.running = True
+            self.tables = []        # per thread: (Lock, { stack (tuple of code objects/builtins): [calls, own seconds] })
+            self.local = local()
+            self.timings = {}       # function name: [calls, total seconds, max seconds]
+            self.started = time.time()
+            name = time.strftime( 'padstrument-%Y%m%d-%H%M%S', time.localtime( self.started ) ) + '-%03i' % ( self.started % 1 * 1000 )
+            self.path = os.path.join( self.directory, name )
+            for name in self.functions:
+                setattr( self.pad, name, self.wrap( name, getattr( self.pad, name ) ) )
+            self.stopping = Event()
+            self.thread = Thread( target=self.run, args=( seconds, ), name="padstrument profiler", daemon=True )
+            self.thread.start()
+        logging.info("profiling for %g seconds", seconds)
+        return True
+
+    def stop(self):
+        '''end the window early - the profiler's thread writes the results.
+        returns the report file name'''
+        with self.lock:
+            if ( not self.running or self.stopping.is_set() ):
+                return False
+            self.stopping.set()
+        return self.path+'.txt'
+
+    def wrap(self, name, func):
+        timing = self.timings[name] = [ 0, 0.0, 0.0 ]
+        profiled = name in self.profiled
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                if ( profiled and sys.getprofile() is None ):
+                    return self.profile( func, args, kwargs )
+                return func( *args, **kwargs )
+            finally:
+                elapsed = time.perf_counter() - start
+                timing[0] += 1
+                timing[1] += elapsed
+                if ( elapsed > timing[2] ):
+                    timing[2] = elapsed
+        return timed
+
+    def table(self):
+        '''this thread's (Lock, stacks) table, made on its first profiled call'''
+        try:
+            return self.local.table
+        except AttributeError:
+            table = self.local.table = ( Lock(), {}, )
+            with self.lock:
+                self.tables.append( table )
+            return table
+
+    def profile(self, func, args, kwargs):
+        '''run func with a profile hook on this thread, adding the own time of every call made
+        under it to the thread's table.  The table's lock is held for the call, so run() can
+        wait out a call in progress before it reads the table.'''
+        lock, stacks = self.table()
+        clock = time.perf_counter
+        frames = [ [ (), 0.0, 0.0 ] ] # open calls: [stack, started, seconds spent in callees]
+
+        def hook(frame, event, arg):
+            now = clock()
+            if ( event == 'call' or event == 'c_call' ):
+                frames.append( [ frames[-1][0] + ( frame.f_code if event == 'call' else arg, ), now, 0.0 ] )
+            elif ( len( frames ) > 1 ): # return, c_return or c_exception of a call seen starting
+                stack, started, inner = frames.pop()
+                elapsed = now - started
+                frames[-1][2] += elapsed
+                entry = stacks.get( stack )
+                if ( entry is None ):
+                    stacks[stack] = [ 1, elapsed - inner ]
+                else:
+                    entry[0] += 1
+                    entry[1] += elapsed - inner
+
+        with lock:
+            sys.setprofile( hook )
+            try:
+                return func( *args, **kwargs )
+            finally:
+                sys.setprofile( None )
+
+    def run(self, seconds):
+        '''profiler thread - waits out the window (or a stop()), then deletes the wrappers and
+        writes the results'''
+        self.stopping.wait( seconds )
+        with self.lock:
+            for name in self.functions:
+                self.pad.__dict__.pop( name, None )
+            timings = { name: list( timing ) for name, timing in self.timings.items() }
+            tables = list( self.tables )
+        stacks = {}
+        for lock, table in tables:
+            with lock:
+                for stack, ( calls, own ) in table.items():
+                    entry = stacks.setdefault( stack, [ 0, 0.0 ] )
+                    entry[0] += calls
+                    entry[1] += own
+        try:
+            self.write( timings, stacks )
+        finally:
+            with self.lock:
+                self.running = False
+
+    @staticmethod
+    def label(code):
+        if ( not hasattr( code, 'co_name' ) ):
+            return "<%s>" % getattr( code, '__qualname__', repr( code ) ) # builtin
+        return "%s (%s:%i)" % ( code.co_name, os.path.basename( code.co_filename ), code.co_firstlineno )
+
+    def write(self, timings, stacks):
+        path = self.path
+        text = io.StringIO()
+        text.write( "function                 calls   total ms    mean ms     max ms\n" )
+        for name, ( calls, total, longest ) in timings.items():
+            mean = total / calls if calls else 0
+            text.write( "%-20s %9i %10.3f %10.4f %10.4f\n" % ( name, calls, total*1000, mean*1000, longest*1000 ) )
+
+        if ( stacks ):
+            calls = {}
+            own = {}
+            inclusive = {}
+            for stack, ( count, seconds ) in stacks.items():
+                calls[ stack[-1] ] = calls.get( stack[-1], 0 ) + count
+                own[ stack[-1] ] = own.get( stack[-1], 0 ) + seconds
+                for code in set( stack ):
+                    inclusive[code] = inclusive.get( code, 0 ) + seconds
+            total = sum( own.values() ) or 1
+            text.write( "\n%.3f ms profiled in %s\n    calls     own ms  own   cumulative  function\n" % ( total*1000,
+                ", ".join( sorted( self.label( code ) for code in { stack[0] for stack in stacks } ) ) ) )
+            for code in sorted( own, key=lambda code: ( -own[code], -inclusive[code] ) )[:30]:
+                text.write( "%9i %10.3f %5.1f%% %9.1f%%  %s\n" % ( calls[code], own[code]*1000, own[code] * 100.0 / total,
+                    inclusive[code] * 100.0 / total, self.label( code ) ) )
+            with open( path+'.folded', 'w' ) as f:
+                for stack, ( count, seconds ) in stacks.items():
+                    weight = int( round( seconds * 1000000 ) )
+                    if ( weight ):
+                        f.write( ";".join( self.label( code ) for code in stack ) + " " + str(weight) + "\n" )
+
+        with open( path+'.txt', 'w' ) as f:
+            f.write( text.getvalue() )
+        logging.info("profile written to %s.txt", path)
+        return path+'.txt'
+
+
+class OSC:
+    '''minimal OSC message encoding - int, float and string arguments'''
+
+    @classmethod
+    def read_string(cls, data, pos):
+        '''returns (string, position after its padding)'''
+        end = data.index( b'\0', pos )
+        return ( data[pos:end].decode(), ( end + 4 ) & ~3, )
+
+    @classmethod
+    def pad(cls, data):
+        data += b'\0'
+        return data + b'\0' * ( -len(data) % 4 )
+
+    @classmethod
+    def decode(cls, data):
+        '''returns (address, [args])'''
+        address, pos = cls.read_string( data, 0 )
+        args = []
+        if ( data[pos:pos+1] == b',' ):
+            tags, pos = cls.read_string( data, pos )
+            for tag in tags[1:]:
+                if ( tag == 'i' ):
+                    args.append( struct.unpack_from( '>i', data, pos )[0] )
+                    pos += 4
+                elif ( tag == 'f' ):
+                    args.append( struct.unpack_from( '>f', data, pos )[0] )
+                    pos += 4
+                elif ( tag == 's' ):
+                    arg, pos = cls.read_string( data, pos )
+                    args.append( arg )
+                else:
+                    raise ValueError( "OSC: unsupported type tag "+tag )
+        return ( address, args, )
+
+    @classmethod
+    def encode(cls, address, *args):
+        tags = ','
+        body = b''
+        for arg in args:
+            if ( type(arg) is int ):
+                tags += 'i'
+                body += struct.pack( '>i', arg )
+            elif ( type(arg) is float ):
+                tags += 'f'
+                body += struct.pack( '>f', arg )
+            else:
+                tags += 's'
+                body += cls.pad( str(arg).encode() )
+        return cls.pad( address.encode() ) + cls.pad( tags.encode() ) + body
+
+
+class Remote:
+    '''local control and metrics server - OSC over UDP, on its own thread, off the note path.
+
+    /padstrument/key tonic [mode] [scale]    Scales.set_key - mode is a number, name or numeral
+    /padstrument/layout name                 Layouts.set_note_layout
+    /padstrument/top padnum                  set_top_NP2
+    /padstrument/zones name                  Zones.set_zone_map
+    /padstrument/profile [seconds]           start a profiling window - 0 stops it early
+    /padstrument/panic                       all notes off
+    /padstrument/state                       replies /padstrument/state json
+    /padstrument/metrics                     replies /padstrument/metrics json
+
+    Control commands are applied with Padstrument.reconfigure(), like the settings buttons, and
+    replied to with /padstrument/ok address or /padstrument/error address reason.
+    The socket is non-blocking - each wakeup drains every waiting request.  State and metrics
+    replies are cached for min_interval, so a client polling at a high rate costs the note path
+    next to nothing.
+    '''
+    min_interval = 0.1 # seconds a state/metrics reply is reused for
+
+    def __init__(self, pad, host='127.0.0.1', port=9123):
+        self.pad = pad
+        self.addr = ( host, port, )
+        self.running = False
+        self.max_burst = 0 # most requests drained in one wakeup
+        self.cache = {}  # address: (time, reply)
+        self.commands = {
+            '/padstrument/key': self.cmd_key,
+            '/padstrument/layout': self.cmd_layout,
+            '/padstrument/top': self.cmd_top,
+            '/padstrument/zones': self.cmd_zones,
+            '/padstrument/profile': self.cmd_profile,
+            '/padstrument/panic': self.cmd_panic,
+            '/padstrument/state': self.cmd_state,
+            '/padstrument/metrics': self.cmd_metrics,
+            }
+
+    def start(self):
+        self.sock = socket.socket( socket.AF_INET, socket.SOCK_DGRAM )
+        self.sock.setblocking( False )
+        try:
+            self.sock.bind( self.addr )
+        except OSError:
+            self.sock.close()
+            raise
+        self.addr = self.sock.getsockname()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register( self.sock, selectors.EVENT_READ )
+        self.running = True
+        self.thread = Thread( target=self.run, name="padstrument-remote", daemon=True )
+        self.thread.start()
+        logging.debug("remote listening on %s:%i", self.addr[0], self.addr[1])
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        self.selector.close()
+        self.sock.close()
+
+    def run(self):
+        while ( self.running ):
+            if ( not self.selector.select( timeout=0.25 ) ):
+                continue
+            count = 0
+            while ( True ):
+                try:
+                    data, sender = self.sock.recvfrom( 4096 )
+                except ( BlockingIOError, InterruptedError ):
+                    break
+                count += 1
+                self.handle( data, sender )
+            if ( count > self.max_burst ):
+                self.max_burst = count
+
+    def handle(self, data, sender):
+        '''decode one request, run it and reply'''
+        try:
+            address, args = OSC.decode( data )
+        except ( ValueError, IndexError, struct.error ):
+            logging.debug("remote: bad packet from %s", sender)
+            return False
+        command = self.commands.get( address )
+        try:
+            if ( command is None ):
+                raise ValueError( "unknown address" )
+            reply = command( *args )
+            self.pad.flush_out()
+        except Exception as e:
+            reply = OSC.encode( '/padstrument/error', address, str(e) )
+        try:
+            self.sock.sendto( reply, sender )
+        except OSError:
+            pass
+        return True
+
+    def ok(self, address, done):
+        if ( not done ):
+            raise ValueError( "rejected" )
+        self.cache.clear()
+        return OSC.encode( '/padstrument/ok', address )
+
+    def cached(self, address, build):
+        '''reply from the cache if it is fresh, otherwise build and cache it'''
+        now = time.monotonic()
+        hit = self.cache.get( address )
+        if ( hit and now - hit[0] < self.min_interval ):
+            return hit[1]
+        reply = OSC.encode( address, json.dumps( build() ) )
+        self.cache[address] = ( now, reply, )
+        return reply
+
+    def cmd_key(self, tonic, mode=None, scale=None):
+        return self.ok( '/padstrument/key', self.pad.reconfigure( tonic=int(tonic), mode=mode, scale=scale ) )
+
+    def cmd_layout(self, name):
+        return self.ok( '/padstrument/layout', self.pad.reconfigure( note_layout=name ) )
+
+    def cmd_top(self, topnum):
+        if ( int(topnum) not in (0, 1) ):
+            raise ValueError( "top must be 0 or 1" )
+        return self.ok( '/padstrument/top', self.pad.reconfigure( top=int(topnum) ) )
+
+    def cmd_zones(self, name):
+        return self.ok( '/padstrument/zones', self.pad.reconfigure( zone_map=name ) )
+
+    def cmd_profile(self, seconds=None):
+        if ( seconds is None ):
+            seconds = self.pad.profile_seconds
+        elif ( not float(seconds) ):
+            return self.ok( '/padstrument/profile', self.pad.profiler.stop() )
+        return self.ok( '/padstrument/profile', self.pad.profiler.start( seconds ) )
+
+    def cmd_panic(self):
+        return self.ok( '/padstrument/panic', self.pad.panic() )
+
+    def cmd_state(self):
+        return self.cached( '/padstrument/state', self.pad.get_state )
+
+    def cmd_metrics(self):
+        return self.cached( '/padstrument/metrics', self.pad.get_metrics )
+
+
+class GridView:
+    '''live terminal (curses) view of the grid - which pads are down, the note each pad plays in
+    the current key, and the active settings page.
+
+    A thread of its own takes a snapshot of the compact pad state at most fps times a second - the
+    pressed bits and padmap of each nanopad and the current settings - and redraws only the cells
+    that changed since the last frame.  The callbacks never wait on the view: it takes no locks,
+    and only reads attributes the callbacks and reconfigure() replace whole, so a frame can be a
+    message behind but is never built from half a padmap.  q closes the view.
+    '''
+    cell_width = 6
+
+    def __init__(self, pad, fps=15):
+        self.pad = pad
+        self.interval = 1.0 / fps
+        self.stop_event = Event()
+        self.thread = False
+        self.labels = {} # id(padmap): (padmap, {pad_note: note name}) - names are worked out once per padmap
+        self.frames = 0
+        self.redrawn = 0 # cells redrawn, over all frames
+
+    def start(self):
+        import curses # only needed with a terminal
+        self.curses = curses
+        self.thread = Thread( target=curses.wrapper, args=( self.run, ), name="padstrument view", daemon=True )
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if ( self.thread ):
+            self.thread.join()
+
+    def is_alive(self):
+        return bool( self.thread ) and self.thread.is_alive()
+
+    def snapshot(self):
+        '''the compact pad state - read only, nothing here waits on the callbacks'''
+        pad = self.pad
+        top = pad.NP2['top']
+        bottom = pad.NP2['bottom']
+        return ( top.padmap, top.pressed, bottom.padmap, bottom.pressed, pad.cur_mode, Scales.get_key(),
+            pad.cur_note_layout, pad.cur_zone_map, pad.topnum, pad.sustain_on, pad.latch_on, )
+
+    def note_names(self, padmap):
+        cached = self.labels.get( id(padmap) )
+        if ( cached and cached[0] is padmap ):
+            return cached[1]
+        if ( len( self.labels ) > 8 ):
+            self.labels.clear()
+        names = { note: num2note[ pad.out_note % 12 ] + str( pad.out_note // 12 - 1 ) for note, pad in padmap.items() } # midi 60 is C4
+        self.labels[ id(padmap) ] = ( padmap, names, )
+        return names
+
+    def frame(self, snapshot):
+        '''{ (y, x): (text, attributes) } for a snapshot'''
+        top_map, top_pressed, bottom_map, bottom_pressed, mode, key, note_layout, zone_map, topnum, sustain, latch = snapshot
+        page = "play" if mode == Padstrument.def_button_mode else "settings "+str(mode)
+        cells = {}
+        cells[ (0, 0) ] = ( "%-40s" % ( "page: "+page ), self.curses.A_BOLD )
+        cells[ (1, 0) ] = ( "%-60s" % ( "key: %s %s mode %i   layout: %s   zones: %s   top: %i" % (
+            num2note[ key[0] % 12 ], key[2], key[1], note_layout, zone_map, topnum ) ), 0 )
+        cells[ (2, 0) ] = ( "%-40s" % ( ( "sustain " if sustain else "" ) + ( "latch" if latch else "" ) ), 0 )
+        for padmap, pressed in ( ( top_map, top_pressed ), ( bottom_map, bottom_pressed ) ):
+            names = self.note_names( padmap )
+            for note, pad in padmap.items():
+                y = 4 + pad.grid_row + ( 1 if pad.grid_row > 1 else 0 ) # gap between the nanopads
+                down = pressed & pad.bit
+                cells[ (y, pad.col * self.cell_width) ] = ( names[note].center( self.cell_width - 1 ),
+                    self.curses.A_REVERSE if down else 0 )
+        cells[ (10, 0) ] = ( "q closes the view", self.curses.A_DIM )
+        return cells
+
+    def run(self, screen):
+        curses = self.curses
+        try:
+            curses.curs_set(0)
+        except curses.error:
+            pass
+        screen.nodelay(True)
+        drawn = {}
+        while ( not self.stop_event.is_set() ):
+            started = time.perf_counter()
+            for position, cell in self.frame( self.snapshot() ).items():
+                if ( drawn.get( position ) != cell ):
+                    try:
+                        screen.addstr( position[0], position[1], cell[0], cell[1] )
+                    except curses.error:
+                        pass # terminal too small - the cell is skipped
+                    drawn[position] = cell
+                    self.redrawn += 1
+            screen.refresh()
+            self.frames += 1
+
+            key = screen.getch()
+            if ( key == ord('q') ):
+                return
+            if ( key == curses.KEY_RESIZE ):
+                screen.clear()
+                drawn = {}
+            self.stop_event.wait( max( 0, self.interval - ( time.perf_counter() - started ) ) )
+
 
 
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser( description="nanoPAD2 instrument" )
+    parser.add_argument( '--osc-port', type=int, default=9123, help="local OSC control/metrics port, 0 for none" )
+    parser.add_argument( '--profile-dir', default='.', help="where on demand profiles are written" )
+    parser.add_argument( '--view', action='store_true', help="live grid view in the terminal - only warnings are logged" )
+    parser.add_argument( '--fps', type=float, default=15, help="grid view frame rate cap" )
+    args = parser.parse_args()
+    Padstrument.profile_dir = args.profile_dir
+
+    # set up logging  - 50 CRITICAL 40 ERROR 30 WARNING 20 INFO 10 DEBUG 0 NOTSET
+    # debug logs every midi message - the view owns the terminal, and is far cheaper
+    logging.basicConfig(level="WARNING" if args.view else "DEBUG",  format='%(levelname)s - %(message)s')
     pad = Padstrument()
-
-    while True:
-        time.sleep(0.02)
+    if ( args.osc_port ):
+        pad.start_remote( args.osc_port )
+    if ( args.view ):
+        pad.start_view( args.fps )
+
+    # kill -USR1 <pid> toggles profiling
+    import signal
+    signal.signal( signal.SIGUSR1, lambda signum, frame: pad.toggle_profile() )
+
+    try:
+        while ( not pad.view or pad.view.is_alive() ):
+            time.sleep(0.02)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if ( pad.view ):
+            pad.view.stop() # gives the terminal back
+        pad.panic() # nothing left sounding on the synths
 
 
 notes="""